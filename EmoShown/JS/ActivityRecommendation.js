@@ -1,7 +1,7 @@
 import React, { useEffect, useState } from 'react';
 import { View, Text, FlatList, TouchableOpacity, StyleSheet, Linking, Animated, Alert } from 'react-native';
 import { firestore } from './firebaseConfig';
-import { collection, query, where, getDocs, orderBy, limit, addDoc } from 'firebase/firestore';
+import { collection, query, where, getDocs, orderBy, limit, addDoc, serverTimestamp } from 'firebase/firestore';
 import recommendationsData from './reco.json';
 
 const ActivityRecommendation = ({ route }) => {
@@ -102,6 +102,7 @@ const ActivityRecommendation = ({ route }) => {
       userId: userId,
       like: like, // User likes or dislikes this item
       type: item.type || 'activity', // Adjust as needed
+      updatedAt: serverTimestamp(), // Lets the Python services sync only changed ratings
     });
 
     // Show the thank you message as a popup
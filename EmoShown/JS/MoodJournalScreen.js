@@ -3,7 +3,7 @@ import { View, Text, TouchableOpacity, TextInput, StyleSheet, Modal, Pressable,
 import { signOut } from 'firebase/auth'; 
 import { auth, firestore, storage } from './firebaseConfig'; 
 import { ref, uploadBytes, getDownloadURL } from 'firebase/storage';
-import { doc, setDoc, getDoc } from 'firebase/firestore'; 
+import { doc, setDoc, getDoc, serverTimestamp } from 'firebase/firestore'; 
 import * as ImagePicker from 'expo-image-picker';
 import { getFirestore, collection, query, where, getDocs } from 'firebase/firestore';
 
@@ -271,6 +271,7 @@ const saveJournalToFirebase = async () => {
       fullName: fullName, // Save the full name
       sentiment: sentiment || {},  // Save the sentiment result
       emotion: selectedEmotion, // Save the selected emotion
+      updatedAt: serverTimestamp(), // Lets the Python services sync only changed journals
     });
     alert('Journal Saved!');
     setJournalEntry(''); // Clear the journal entry after saving
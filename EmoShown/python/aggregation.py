@@ -0,0 +1,88 @@
+from datetime import date
+from flask import Blueprint, Flask, request, jsonify
+from flask_cors import CORS
+from firestore_client import get_db
+from local_store import LocalStore, FirestoreSync
+from instrumentation import get_logger, span
+import instrumentation
+
+bp = Blueprint('aggregation', __name__)
+
+log = get_logger('aggregation')
+
+# Rollups are maintained by the local journals mirror every time journals are synced
+local_store = LocalStore('local_store.db')
+
+# Serve one page of a user's pre-aggregated mood series
+def rollup_page(period):
+    user_id = request.args.get('userId')
+    if not user_id:
+        return jsonify({'error': 'No userId provided'}), 400
+
+    try:
+        limit = int(request.args.get('limit', '30'))
+    except ValueError:
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+    if limit < 1:
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+    # cursor, start and end are days ('YYYY-MM-DD'), weeks are keyed by their Monday
+    days = {}
+    for name in ('cursor', 'start', 'end'):
+        value = request.args.get(name)
+        if value is not None:
+            try:
+                value = date.fromisoformat(value).isoformat()
+            except ValueError:
+                return jsonify({'error': f'{name} must be a date in YYYY-MM-DD format'}), 400
+        days[name] = value
+
+    with span('aggregation', 'fetch'):
+        items, next_cursor = local_store.rollups(
+            period,
+            user_id,
+            cursor=days['cursor'],
+            limit=limit,
+            descending=request.args.get('order', 'desc') != 'asc',
+            start=days['start'],
+            end=days['end'],
+        )
+    with span('aggregation', 'serialize'):
+        return jsonify({'items': items, 'nextCursor': next_cursor}), 200
+
+# Per-day mean sentiment, emotion counts and entry counts, newest first
+@bp.route('/rollups/daily', methods=['GET'])
+def daily_rollups_route():
+    try:
+        return rollup_page('daily')
+    except Exception as e:
+        log.exception('Daily rollups failed')
+        return jsonify({'error': str(e)}), 500
+
+# The same series per ISO week, keyed by the week's Monday
+@bp.route('/rollups/weekly', methods=['GET'])
+def weekly_rollups_route():
+    try:
+        return rollup_page('weekly')
+    except Exception as e:
+        log.exception('Weekly rollups failed')
+        return jsonify({'error': str(e)}), 500
+
+# Nothing to load up front
+def preload():
+    pass
+
+# In the combined server anomaly.py already syncs journals into the same mirror
+def start_worker():
+    pass
+
+def start_background():
+    pass
+
+app = Flask(__name__)
+CORS(app, resources={r"/*": {"origins": "*"}})
+app.register_blueprint(bp)
+app.register_blueprint(instrumentation.bp)
+
+if __name__ == '__main__':
+    FirestoreSync(get_db(), local_store, collections=['journals']).start(interval=60)
+    app.run(debug=True, host='0.0.0.0', use_reloader=False)
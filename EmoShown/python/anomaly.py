@@ -1,58 +1,59 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, request, jsonify
 from flask_cors import CORS
 from datetime import datetime
-import firebase_admin
-from firebase_admin import credentials, firestore
-from sklearn.ensemble import IsolationForest
-import pandas as pd
-from sklearn.preprocessing import OneHotEncoder
+from firestore_client import get_db
+from local_store import LocalStore, FirestoreSync
+from anomaly_engine import AnomalyEngine
+from instrumentation import get_logger, span
+import instrumentation
 
-# Initialize Firebase
-cred = credentials.Certificate('emoshown-firebase-adminsdk.json')
-firebase_admin.initialize_app(cred)
+bp = Blueprint('anomaly', __name__)
 
-# Initialize Firestore
-db = firestore.client()
+log = get_logger('anomaly')
 
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})  # You can replace "*" with the specific origin if needed
+# Local mirror of the journals collection, kept up to date with incremental syncs
+local_store = LocalStore('local_store.db')
 
-# Fetch data from the 'journals' collection in Firebase
-def fetch_journals():
-    journals_ref = db.collection('journals')
-    docs = journals_ref.stream()
+# Per-user streaming anomaly state, forests are refit from the local journals in the background
+anomaly_engine = AnomalyEngine('anomaly_state.db', load_history=lambda user_id: fetch_journals(user_id))
 
-    data = []
-    for doc in docs:
-        journal_data = doc.to_dict()
-        data.append(journal_data)
+# Fetch data from the local mirror of the 'journals' collection,
+# optionally for one user and an inclusive 'YYYY-MM-DD' day window
+def fetch_journals(user_id=None, start=None, end=None):
+    with span('anomaly', 'fetch'):
+        data = local_store.journals(user_id, start, end)
 
-    print("Fetched Journals Data:", data)  # Log the fetched data
+    log.debug('Fetched journals', extra={'user_id': user_id, 'start': start, 'end': end, 'count': len(data)})
     return data
 
 # Convert emotion categories to numerical values using OneHotEncoder
 def preprocess_data(data):
+    import pandas as pd
+    from sklearn.preprocessing import OneHotEncoder
+
     # Create DataFrame from the input data
-    df = pd.DataFrame(data)
+    with span('anomaly', 'dataframe'):
+        df = pd.DataFrame(data)
 
     # Ensure 'emotion' column exists and handle missing values
     if 'emotion' in df.columns:
         df['emotion'] = df['emotion'].fillna('unknown')  # Fill missing emotions with 'unknown'
         
-        # Initialize OneHotEncoder
-        encoder = OneHotEncoder(sparse_output=False)  # Use sparse_output=False to get a dense array
-        
-        # Fit and transform the 'emotion' column
-        encoded_emotions = encoder.fit_transform(df[['emotion']])
-        
-        # Create a DataFrame with the one-hot encoded emotion values
-        encoded_emotion_df = pd.DataFrame(
-            encoded_emotions, 
-            columns=encoder.get_feature_names_out(['emotion'])
-        )
-        
-        # Concatenate the encoded emotions with the original DataFrame
-        df = pd.concat([df, encoded_emotion_df], axis=1)
+        with span('anomaly', 'encode'):
+            # Initialize OneHotEncoder
+            encoder = OneHotEncoder(sparse_output=False)  # Use sparse_output=False to get a dense array
+
+            # Fit and transform the 'emotion' column
+            encoded_emotions = encoder.fit_transform(df[['emotion']])
+
+            # Create a DataFrame with the one-hot encoded emotion values
+            encoded_emotion_df = pd.DataFrame(
+                encoded_emotions,
+                columns=encoder.get_feature_names_out(['emotion'])
+            )
+
+            # Concatenate the encoded emotions with the original DataFrame
+            df = pd.concat([df, encoded_emotion_df], axis=1)
         
         # Drop the original 'emotion' column as it's no longer needed
         df = df.drop(columns=['emotion'])
@@ -61,6 +62,9 @@ def preprocess_data(data):
 
 # Anomaly Detection with Isolation Forest
 def detect_anomalies(data):
+    import pandas as pd
+    from sklearn.ensemble import IsolationForest
+
     df = preprocess_data(data)
 
     # If the dataframe is empty or missing necessary columns
@@ -82,8 +86,9 @@ def detect_anomalies(data):
     df['sentiment_change'] = df['sentiment'].diff().fillna(0)
 
     # Create and fit the Isolation Forest model
-    model = IsolationForest(contamination=0.1)
-    df['anomaly'] = model.fit_predict(df[['sentiment']])
+    with span('anomaly', 'fit'):
+        model = IsolationForest(contamination=0.1)
+        df['anomaly'] = model.fit_predict(df[['sentiment']])
 
     # Anomalies are marked as -1
     anomalies = df[df['anomaly'] == -1][['date', 'sentiment_change']]
@@ -94,17 +99,59 @@ def detect_anomalies(data):
 
     return anomalies[['day', 'change']]
 
-@app.route('/detect_anomalies', methods=['POST'])
+@bp.route('/detect_anomalies', methods=['POST'])
 def anomaly_detection_route():
     try:
         data = request.json
-        print(data)
+        log.debug('Anomaly detection request', extra={'entries': len(data) if isinstance(data, list) else None})
         anomalies = detect_anomalies(data)
-        anomalies_json = anomalies.to_dict(orient='records')
-        return jsonify(anomalies_json), 200
+        with span('anomaly', 'serialize'):
+            anomalies_json = anomalies.to_dict(orient='records')
+            return jsonify(anomalies_json), 200
     except Exception as e:
-        print(f"Error: {e}", flush=True)  # Ensure the error is printed to the log
+        log.exception('Anomaly detection failed')
         return jsonify({'error': str(e)}), 500
 
+# Score only the entries added since the user's cursor against their stored state; clients resend
+# their entries from the cursor day onwards, already processed ones are skipped
+@bp.route('/detect_anomalies/incremental', methods=['POST'])
+def incremental_anomaly_detection_route():
+    try:
+        data = request.json
+        user_id = data.get('userId')
+        entries = data.get('entries', [])
+
+        if not user_id:
+            return jsonify({'error': 'No userId provided'}), 400
+
+        with span('anomaly', 'predict'):
+            anomalies, cursor = anomaly_engine.process(user_id, entries)
+        with span('anomaly', 'serialize'):
+            return jsonify({'anomalies': anomalies, 'cursor': cursor}), 200
+    except Exception as e:
+        log.exception('Incremental anomaly detection failed')
+        return jsonify({'error': str(e)}), 500
+
+# Import pandas/sklearn up front so forked workers share them
+def preload():
+    import pandas
+    import sklearn.ensemble
+    import sklearn.preprocessing
+
+# Workers read user state from anomaly_state.db on every request, there is nothing to follow
+def start_worker():
+    pass
+
+# Start the Firestore sync and the forest refit thread; run in one process only
+def start_background():
+    FirestoreSync(get_db(), local_store, collections=['journals']).start(interval=60)
+    anomaly_engine.start(interval=3600)
+
+app = Flask(__name__)
+CORS(app, resources={r"/*": {"origins": "*"}})  # You can replace "*" with the specific origin if needed
+app.register_blueprint(bp)
+app.register_blueprint(instrumentation.bp)
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0')
+    start_background()
+    app.run(debug=True, host='0.0.0.0', use_reloader=False)
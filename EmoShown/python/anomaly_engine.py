@@ -0,0 +1,260 @@
+import hashlib
+import json
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from local_store import parse_day
+from sqlite_connection import SqliteConnection
+from instrumentation import get_logger, span
+
+log = get_logger('anomaly_engine')
+
+# Weight of the newest entry in the rolling mean/variance
+ALPHA = 0.1
+
+# Entries a user needs before their entries are scored
+MIN_HISTORY = 5
+
+# Day-to-day changes further than this many standard deviations from the rolling mean are anomalies
+Z_THRESHOLD = 2.5
+
+# Entries a user needs before an IsolationForest is fitted for them
+MIN_FIT = 10
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS anomaly_state (
+    user_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    forest BLOB,
+    fitted_at REAL
+);
+'''
+
+
+# Compact running state of one user's mood history
+class UserState:
+    def __init__(self, data=None):
+        data = data or {}
+        self.count = data.get('count', 0)
+        self.mean = data.get('mean', 0.0)
+        self.var = data.get('var', 0.0)
+        self.change_mean = data.get('change_mean', 0.0)
+        self.change_var = data.get('change_var', 0.0)
+        self.last_sentiment = data.get('last_sentiment')
+        self.cursor = data.get('cursor')
+        # Keys of the entries on the cursor day already processed, a day can hold several journals
+        self.cursor_keys = data.get('cursor_keys', [])
+        self.since_fit = data.get('since_fit', 0)
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+# Identity of an entry within its day: the journal document id, or a digest of its content
+# for clients that do not send ids
+def entry_key(entry):
+    if entry.get('id'):
+        return str(entry['id'])
+    content = json.dumps([entry.get(field) for field in ('date', 'emotion', 'sentiment', 'journalEntry')],
+                         sort_keys=True, default=str)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+
+
+# Exponentially weighted mean and variance after adding value
+def ewm_update(mean, var, value, first):
+    if first:
+        return value, 0.0
+    diff = value - mean
+    increment = ALPHA * diff
+    return mean + increment, (1 - ALPHA) * (var + diff * increment)
+
+
+# Scores new journal entries one at a time against per-user running state.
+# Each user keeps a rolling mean/variance of their sentiment and of its day-to-day change
+# and, once fitted by the background job, an IsolationForest.
+# Scoring an entry is O(1) in the length of the history; states are persisted in SQLite.
+# Every worker process shares the file: a user's state is read, updated and written back in one
+# IMMEDIATE transaction, so concurrent requests for the same user are applied one after the other.
+class AnomalyEngine:
+    def __init__(self, path='anomaly_state.db', load_history=None):
+        # load_history(user_id) returns the user's journals, used when refitting forests
+        self.load_history = load_history
+        self.lock = threading.RLock()
+        self.connection = SqliteConnection(path, self._setup)
+        # user_id -> (fitted_at, forest), reloaded when another process refits the forest
+        self.forests = {}
+        self.thread = None
+
+    @staticmethod
+    def _setup(db):
+        db.execute('PRAGMA journal_mode=WAL')
+        db.executescript(SCHEMA)
+        db.commit()
+
+    @property
+    def db(self):
+        return self.connection.get()
+
+    @contextmanager
+    def _transaction(self):
+        with self.lock:
+            db = self.db
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                yield db
+            except BaseException:
+                db.rollback()
+                raise
+            db.commit()
+
+    # The user's persisted state and forest, read inside the caller's transaction
+    def _load(self, db, user_id):
+        row = db.execute('SELECT state, fitted_at FROM anomaly_state WHERE user_id = ?', (user_id,)).fetchone()
+        if row is None:
+            return UserState(), None
+        state, fitted_at = UserState(json.loads(row[0])), row[1]
+        if fitted_at is None:
+            return state, None
+        cached = self.forests.get(user_id)
+        if cached is None or cached[0] != fitted_at:
+            blob = db.execute('SELECT forest FROM anomaly_state WHERE user_id = ?', (user_id,)).fetchone()[0]
+            cached = self.forests[user_id] = (fitted_at, pickle.loads(blob))
+        return state, cached[1]
+
+    @staticmethod
+    def _save(db, user_id, state):
+        db.execute(
+            'INSERT INTO anomaly_state (user_id, state) VALUES (?, ?) '
+            'ON CONFLICT(user_id) DO UPDATE SET state = excluded.state',
+            (user_id, json.dumps(state.to_dict())),
+        )
+
+    # Sentiments the forest isolates as outliers, predicted in one call
+    @staticmethod
+    def _outliers(forest, sentiments):
+        if forest is None or not sentiments:
+            return set()
+        sentiments = sorted(set(sentiments))
+        labels = forest.predict([[sentiment] for sentiment in sentiments])
+        return {sentiment for sentiment, label in zip(sentiments, labels) if label == -1}
+
+    def _score(self, outliers, state, sentiment):
+        reasons = []
+        change = sentiment - state.last_sentiment if state.last_sentiment is not None else 0.0
+        if state.count >= MIN_HISTORY:
+            std = state.change_var ** 0.5
+            if std > 0 and abs(change - state.change_mean) / std > Z_THRESHOLD:
+                reasons.append('sentiment_change')
+            if sentiment in outliers:
+                reasons.append('isolation_forest')
+        return change, reasons
+
+    def _update(self, state, sentiment, change):
+        first = state.count == 0
+        state.mean, state.var = ewm_update(state.mean, state.var, sentiment, first)
+        if not first:
+            state.change_mean, state.change_var = ewm_update(
+                state.change_mean, state.change_var, change, state.count == 1
+            )
+        state.last_sentiment = sentiment
+        state.count += 1
+        state.since_fit += 1
+
+    # Score entries added since the user's cursor and fold them into their state.
+    # Entries before the cursor day, and entries on it that were already processed, are skipped,
+    # so resending everything from the cursor day onwards is harmless.
+    # Returns the anomalies, in the same day/change format as /detect_anomalies, and the new cursor.
+    def process(self, user_id, entries):
+        parsed = []
+        for entry in entries:
+            day = parse_day(entry.get('date'))
+            # Days the app fills in without a journal entry carry no signal
+            if day is None or entry.get('emotion') == 'blank':
+                continue
+            sentiment = entry.get('sentiment')
+            if isinstance(sentiment, dict):
+                sentiment = sentiment.get('compound')
+            try:
+                sentiment = float(sentiment)
+            except (TypeError, ValueError):
+                # Missing or not a number
+                continue
+            parsed.append((day, entry_key(entry), sentiment))
+        parsed.sort(key=lambda item: item[:2])
+
+        # The forest scores every new entry in one call before the write lock is taken
+        with self.lock:
+            state, forest = self._load(self.db, user_id)
+        outliers = self._outliers(forest, [sentiment for day, _, sentiment in parsed
+                                           if state.cursor is None or day >= state.cursor])
+
+        anomalies = []
+        with self._transaction() as db:
+            state, current = self._load(db, user_id)
+            if current is not forest:
+                # Refit since the entries were scored
+                outliers = self._outliers(current, [sentiment for _, _, sentiment in parsed])
+            for day, key, sentiment in parsed:
+                if state.cursor is not None and (day < state.cursor or
+                                                 (day == state.cursor and key in state.cursor_keys)):
+                    continue
+                change, reasons = self._score(outliers, state, sentiment)
+                if reasons:
+                    anomalies.append({
+                        'day': datetime.strptime(day, '%Y-%m-%d').strftime('%A, %B %d, %Y'),
+                        'change': round(change * 100, 2),
+                        'reasons': reasons,
+                    })
+                self._update(state, sentiment, change)
+                if day != state.cursor:
+                    state.cursor, state.cursor_keys = day, []
+                state.cursor_keys.append(key)
+            self._save(db, user_id, state)
+        return anomalies, state.cursor
+
+    # Fit an IsolationForest on the user's full history and persist it
+    def refit(self, user_id, history=None):
+        if history is None:
+            history = self.load_history(user_id)
+        sentiments = [[float(entry['sentiment'])] for entry in history
+                      if entry.get('sentiment') is not None and entry.get('emotion') != 'blank']
+        if len(sentiments) < MIN_FIT:
+            return False
+        from sklearn.ensemble import IsolationForest
+        with span('anomaly', 'refit'):
+            forest = IsolationForest(contamination=0.1, random_state=42).fit(sentiments)
+        fitted_at = time.time()
+        with self._transaction() as db:
+            state, _ = self._load(db, user_id)
+            state.since_fit = 0
+            db.execute(
+                'INSERT INTO anomaly_state (user_id, state, forest, fitted_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(user_id) DO UPDATE SET state = excluded.state, forest = excluded.forest, '
+                'fitted_at = excluded.fitted_at',
+                (user_id, json.dumps(state.to_dict()), pickle.dumps(forest), fitted_at),
+            )
+            self.forests[user_id] = (fitted_at, forest)
+        return True
+
+    # Refit every user with at least min_new entries since their last fit
+    def refit_all(self, min_new=MIN_FIT):
+        with self.lock:
+            rows = self.db.execute('SELECT user_id, state FROM anomaly_state').fetchall()
+            users = [user_id for user_id, data in rows if UserState(json.loads(data)).since_fit >= min_new]
+        return sum(1 for user_id in users if self.refit(user_id))
+
+    def _run(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                log.info('Anomaly forests refit', extra={'users': self.refit_all()})
+            except Exception:
+                log.exception('Anomaly refit failed')
+
+    # Refit forests every interval seconds in a background thread
+    def start(self, interval=3600):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, args=(interval,), name='anomaly-refit', daemon=True)
+            self.thread.start()
@@ -1,13 +1,61 @@
-from flask import Flask, request, jsonify
+import os
+import threading
+from flask import Blueprint, Flask, request, jsonify
 from flask_cors import CORS
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+from sentiment_cache import SentimentCache, lexicon_version
+from instrumentation import get_logger, span
+import instrumentation
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for cross-origin requests
+bp = Blueprint('sentiment', __name__)
+
+log = get_logger('sentiment')
+
+# Largest number of entries accepted by /analyze/batch in one request
+MAX_BATCH_SIZE = 5000
+
+# Sentiment results cache, set SENTIMENT_CACHE_DB to an empty string to keep it in memory only
+SENTIMENT_CACHE_SIZE = int(os.environ.get('SENTIMENT_CACHE_SIZE', 10000))
+SENTIMENT_CACHE_DB = os.environ.get('SENTIMENT_CACHE_DB', 'sentiment_cache.db')
+
+_lock = threading.Lock()
+_engine = None
+_cache = None
+
+# Scoring engine and results cache, built on first use since loading the lexicons takes a while
+def get_engine():
+    global _engine, _cache
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+                from vader_engine import VaderEngine
+
+                analyzer = SentimentIntensityAnalyzer()
+                _cache = SentimentCache(lexicon_version(analyzer), max_size=SENTIMENT_CACHE_SIZE,
+                                        db_path=SENTIMENT_CACHE_DB or None)
+                _engine = VaderEngine(analyzer)
+    return _engine
+
+def get_cache():
+    get_engine()
+    return _cache
+
+# Load the lexicons so forked workers share them
+def preload():
+    get_engine()
+
+# Nothing runs in the background for sentiment analysis
+def start_worker():
+    pass
+
+def start_background():
+    pass
 
-analyzer = SentimentIntensityAnalyzer()
+# Combine text and emotion for analysis
+def combine_text(text, emotion):
+    return f'{emotion} {text}'.strip().lower()
 
-@app.route('/analyze', methods=['POST'])
+@bp.route('/analyze', methods=['POST'])
 def analyze_sentiment():
     try:
         data = request.json
@@ -17,15 +65,74 @@ def analyze_sentiment():
         if not text and not emotion:
             return jsonify({'error': 'No text or emotion provided'}), 400
 
-        # Combine text and emotion for analysis
-        combined_text = f'{emotion} {text}'.strip().lower()
+        combined_text = combine_text(text, emotion)
 
-        # Perform sentiment analysis
-        scores = analyzer.polarity_scores(combined_text)
-        return jsonify(scores)
+        # Perform sentiment analysis, re-saved entries and emotion-only inputs come from the cache
+        with span('sentiment', 'predict'):
+            scores = get_cache().get_or_compute(combined_text, get_engine().polarity_scores)
+        with span('sentiment', 'serialize'):
+            return jsonify(scores)
     except Exception as e:
+        log.exception('Sentiment analysis failed')
         return jsonify({'error': str(e)}), 500
 
+# Score many journal entries in one request, e.g. when re-scoring a user's history
+@bp.route('/analyze/batch', methods=['POST'])
+def analyze_sentiment_batch():
+    try:
+        data = request.json
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be an object with entries'}), 400
+        entries = data.get('entries')
+
+        if not isinstance(entries, list) or not entries:
+            return jsonify({'error': 'No entries provided'}), 400
+        if len(entries) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'Too many entries, the limit is {MAX_BATCH_SIZE}'}), 400
+
+        texts, errors = [], {}
+        for i, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                texts.append(None)
+                errors[i] = 'Entry must be an object with text and emotion'
+                continue
+            text = entry.get('text', '')
+            emotion = entry.get('emotion', '')
+            texts.append(combine_text(text, emotion) if text or emotion else None)
+
+        # Look every valid entry up in the cache and score the misses in one pass,
+        # entries that are not objects or have no text or emotion get an error
+        engine = get_engine()
+        cache = get_cache()
+        with span('sentiment', 'cache'):
+            results = [cache.get(text) if text is not None
+                       else {'error': errors.get(i, 'No text or emotion provided')}
+                       for i, text in enumerate(texts)]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            with span('sentiment', 'predict'):
+                scores = engine.score_batch([texts[i] for i in missing])
+            for i, score in zip(missing, scores):
+                results[i] = score
+            with span('sentiment', 'cache'):
+                cache.put_many(zip((texts[i] for i in missing), scores))
+        log.debug('Batch scored', extra={'entries': len(entries), 'computed': len(missing)})
+        with span('sentiment', 'serialize'):
+            return jsonify({'results': results})
+    except Exception as e:
+        log.exception('Batch sentiment analysis failed')
+        return jsonify({'error': str(e)}), 500
+
+# Cache counters, used to size the cache
+@bp.route('/analyze/cache', methods=['GET'])
+def sentiment_cache_stats():
+    return jsonify(get_cache().stats())
+
+app = Flask(__name__)
+CORS(app)  # Enable CORS for cross-origin requests
+app.register_blueprint(bp)
+app.register_blueprint(instrumentation.bp)
+
 if __name__ == '__main__':
     # Use host='0.0.0.0' to make it accessible on the local network
     app.run(debug=True, host='0.0.0.0')
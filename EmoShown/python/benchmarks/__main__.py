@@ -0,0 +1,116 @@
+# Benchmark and load-test runner, run from EmoShown/python:
+#
+#   python -m benchmarks micro --users 100000 --output micro.json
+#   python -m benchmarks load --concurrency 1,8,32 --requests 500 --output load.json
+#   python -m benchmarks all --output baseline.json
+#   python -m benchmarks compare baseline.json current.json --threshold 0.15
+#
+# Everything runs on synthetic data with a fixed seed and never touches Firestore;
+# the SQLite files the services create go to a temporary directory unless --workdir is given.
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from benchmarks import compare, load, micro
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def metadata(args):
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'options': {key: value for key, value in vars(args).items() if key not in ('command', 'output', 'workdir')},
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    for name in ('micro', 'load', 'all'):
+        command = commands.add_parser(name)
+        command.add_argument('--output', help='write the results as JSON to this file')
+        command.add_argument('--workdir', help='directory for the SQLite files, a temporary one by default')
+        command.add_argument('--seed', type=int, default=0)
+        if name in ('micro', 'all'):
+            command.add_argument('--only', nargs='+', choices=list(micro.BENCHMARKS), help='micro-benchmarks to run')
+            command.add_argument('--users', type=int, default=1000, help='users in the recoratings data')
+            command.add_argument('--texts', type=int, default=1000, help='texts scored per polarity_scores run')
+            command.add_argument('--days', type=int, default=365, help='days of mood history for anomaly detection')
+            command.add_argument('--repeat', type=int, default=5)
+            command.add_argument('--no-reference', dest='reference', action='store_false',
+                                 help='skip recommend_items itself, e.g. at a million users')
+        if name in ('load', 'all'):
+            command.add_argument('--scenarios', nargs='+', choices=list(load.SCENARIOS))
+            command.add_argument('--concurrency', default='1,4,16', help='comma separated thread counts')
+            command.add_argument('--requests', type=int, default=200, help='requests per scenario and concurrency')
+            command.add_argument('--load-users', type=int, default=200, help='users seeded for the load test')
+            command.add_argument('--load-days', type=int, default=90, help='days of journals seeded per user')
+
+    command = commands.add_parser('compare')
+    command.add_argument('baseline')
+    command.add_argument('current')
+    command.add_argument('--threshold', type=float, default=0.15, help='relative change flagged as a regression')
+    return parser.parse_args(argv)
+
+
+def run(args):
+    results = {}
+    if args.command in ('micro', 'all'):
+        results.update(micro.run(args.only, users=args.users, texts=args.texts, days=args.days,
+                                 repeat=args.repeat, seed=args.seed, reference=args.reference))
+    if args.command in ('load', 'all'):
+        concurrency = [int(level) for level in args.concurrency.split(',')]
+        results.update(load.run(args.scenarios, concurrency=concurrency, requests=args.requests,
+                                users=args.load_users, days=args.load_days, seed=args.seed))
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'compare':
+        rows = compare.compare(compare.load(args.baseline), compare.load(args.current), args.threshold)
+        return 1 if compare.report(rows, args.threshold) else 0
+
+    output = os.path.abspath(args.output) if args.output else None
+    # The service modules are imported from EmoShown/python, the SQLite files go to the work directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    workdir = args.workdir or tempfile.mkdtemp(prefix='emoshown-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    try:
+        started = time.perf_counter()
+        report = {'meta': metadata(args), 'results': run(args)}
+        report['meta']['seconds'] = round(time.perf_counter() - started, 1)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+        print(f'Results written to {output}')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,35 @@
+import json
+
+# Metrics compared between runs; a regression is a change in the bad direction larger than the threshold
+LOWER_IS_BETTER = ['median_ms', 'p50_ms', 'p95_ms', 'p99_ms']
+HIGHER_IS_BETTER = ['ops_per_sec', 'rps']
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# Compare the results of two runs and return rows of (benchmark, metric, baseline, current, change, regressed).
+# change is the relative change, positive meaning slower / lower throughput.
+def compare(baseline, current, threshold=0.15):
+    rows = []
+    for name in sorted(set(baseline['results']) & set(current['results'])):
+        before, after = baseline['results'][name], current['results'][name]
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            if not before.get(metric) or after.get(metric) is None:
+                continue
+            change = (after[metric] - before[metric]) / before[metric]
+            if metric in HIGHER_IS_BETTER:
+                change = -change
+            rows.append((name, metric, before[metric], after[metric], round(change, 4), change > threshold))
+    return rows
+
+
+def report(rows, threshold):
+    for name, metric, before, after, change, regressed in rows:
+        flag = 'REGRESSION' if regressed else ''
+        print(f'{name:50} {metric:12} {before:>12} {after:>12} {change:+8.1%} {flag}')
+    regressions = sum(1 for row in rows if row[-1])
+    print(f'{regressions} regression(s) over {threshold:.0%} in {len(rows)} comparisons')
+    return regressions
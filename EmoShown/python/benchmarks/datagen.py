@@ -0,0 +1,118 @@
+import random
+from datetime import date, timedelta
+
+# The twelve emotions the app offers, with how often they are picked and their usual sentiment
+EMOTIONS = {
+    'happy': (0.18, 0.6), 'excited': (0.07, 0.7), 'grateful': (0.08, 0.65), 'calm': (0.14, 0.4),
+    'bored': (0.08, -0.05), 'numb': (0.04, -0.1), 'confused': (0.05, -0.15), 'doubt': (0.04, -0.1),
+    'angry': (0.07, -0.6), 'lonely': (0.07, -0.5), 'sad': (0.11, -0.6), 'worried': (0.07, -0.45),
+}
+
+POSITIVE = ['happy', 'great', 'good', 'love', 'wonderful', 'grateful', 'relaxed', 'fun', 'excited', 'proud',
+            'amazing', 'better', 'glad', 'peaceful', 'nice']
+NEGATIVE = ['sad', 'tired', 'angry', 'lonely', 'worried', 'stressed', 'bad', 'awful', 'anxious', 'hurt',
+            'upset', 'afraid', 'bored', 'hate', 'terrible']
+MODIFIERS = ['very', 'really', 'so', 'kind of', 'slightly', 'extremely', 'not', "didn't", 'never', 'barely']
+FILLER = ('today i went to work and then met my friends for lunch we talked about school and family '
+          'the weather was cold in the morning and i stayed home after class my brother called me '
+          'in the evening i tried to read a book before going to sleep tomorrow i have an exam but '
+          'maybe we will go out on the weekend i cooked dinner and watched a movie').split()
+EMOJI = ['😀', '😂', '😢', '😡', '❤️', '👍', '😴', '🙏', '🎉', '😞', '😊', '🔥', '💔', '😐', '🤔']
+
+
+def _sentence(rng, polarity):
+    words = rng.sample(FILLER, rng.randint(4, 12))
+    for _ in range(rng.randint(1, 3)):
+        pool = POSITIVE if rng.random() < 0.5 + polarity / 2 else NEGATIVE
+        word = rng.choice(pool)
+        if rng.random() < 0.3:
+            word = f'{rng.choice(MODIFIERS)} {word}'
+        words.insert(rng.randint(0, len(words)), word)
+    text = ' '.join(words)
+    return text + rng.choice(['.', '.', '!', '!!', '?', '...'])
+
+
+# Journal text whose tone roughly follows polarity (-1..1), 1 to 8 sentences long
+def journal_text(rng, polarity=0.0, emoji_rate=0.0):
+    text = ' '.join(_sentence(rng, polarity) for _ in range(rng.randint(1, 8)))
+    if emoji_rate:
+        words = text.split(' ')
+        for i in range(len(words)):
+            if rng.random() < emoji_rate:
+                words[i] += rng.choice(EMOJI)
+        text = ' '.join(words)
+    return text
+
+
+def pick_emotion(rng):
+    emotions = list(EMOTIONS)
+    return rng.choices(emotions, weights=[EMOTIONS[emotion][0] for emotion in emotions])[0]
+
+
+# Texts for polarity_scores, emoji_rate is the share of words followed by an emoji
+def texts(count, seed=0, emoji_rate=0.0):
+    rng = random.Random(seed)
+    result = []
+    for _ in range(count):
+        emotion = pick_emotion(rng)
+        result.append(f'{emotion} {journal_text(rng, EMOTIONS[emotion][1], emoji_rate)}'.lower())
+    return result
+
+
+# Journals documents as the app saves them, one entry on most days for every user
+def journals(users, days, seed=0, start=date(2026, 1, 1), skip_rate=0.2, with_text=True):
+    rng = random.Random(seed)
+    docs = []
+    for u in range(users):
+        user_id = f'user{u}'
+        mood = rng.uniform(-0.3, 0.3)
+        for d in range(days):
+            if rng.random() < skip_rate:
+                continue
+            emotion = pick_emotion(rng)
+            mood = 0.7 * mood + 0.3 * EMOTIONS[emotion][1]
+            compound = max(-1.0, min(1.0, rng.gauss(mood, 0.25)))
+            day = start + timedelta(days=d)
+            docs.append((f'{user_id}_{d}', {
+                'userId': user_id,
+                'date': day.strftime('%B %d, %Y').replace(' 0', ' '),
+                'emotion': emotion,
+                'sentiment': {'compound': round(compound, 4)},
+                'journalEntry': journal_text(rng, compound) if with_text else '',
+            }))
+    return docs
+
+
+# Mood history in the format AnalysisScreen.js posts to /detect_anomalies
+def mood_history(days, seed=0, start=date(2026, 1, 1)):
+    rng = random.Random(seed)
+    history = []
+    mood = 0.0
+    for d in range(days):
+        day = start + timedelta(days=d)
+        emotion = pick_emotion(rng)
+        mood = 0.7 * mood + 0.3 * EMOTIONS[emotion][1]
+        # An occasional sharp swing, the kind of day the detector should flag
+        sentiment = rng.choice([-0.9, 0.9]) if rng.random() < 0.05 else rng.gauss(mood, 0.2)
+        history.append({
+            'day': day.strftime('%a'),
+            'date': day.strftime('%B %d, %Y').replace(' 0', ' '),
+            'emotion': emotion,
+            'sentiment': round(max(-1.0, min(1.0, sentiment)), 4),
+        })
+    return history
+
+
+# recoratings documents for users rating a few catalog items each, yielded lazily so
+# a million users does not need the whole list in memory at once
+def recoratings(users, titles, ratings_per_user=5, seed=0):
+    rng = random.Random(seed)
+    # Users fall into taste groups, so there is structure for the factorization to find
+    groups = [rng.sample(titles, max(1, len(titles) // 3)) for _ in range(5)]
+    n = 0
+    for u in range(users):
+        liked = groups[u % len(groups)]
+        for title in rng.sample(titles, min(ratings_per_user, len(titles))):
+            like = rng.random() < (0.8 if title in liked else 0.3)
+            yield f'rating{n}', {'userId': f'user{u}', 'title': title, 'like': like, 'type': 'Activity'}
+            n += 1
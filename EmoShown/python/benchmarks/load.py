@@ -0,0 +1,126 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks import datagen
+from benchmarks.timing import percentile
+
+SENTIMENTS = ['positive', 'neutral', 'negative']
+
+
+# Request builders, each returns (method, path, json body) for the i-th request of a run
+def analyze_request(rng, i, users):
+    emotion = datagen.pick_emotion(rng)
+    return 'POST', '/analyze', {'text': datagen.journal_text(rng, datagen.EMOTIONS[emotion][1]), 'emotion': emotion}
+
+
+def analyze_batch_request(rng, i, users):
+    entries = []
+    for _ in range(50):
+        emotion = datagen.pick_emotion(rng)
+        entries.append({'text': datagen.journal_text(rng, datagen.EMOTIONS[emotion][1]), 'emotion': emotion})
+    return 'POST', '/analyze/batch', {'entries': entries}
+
+
+def recommend_request(rng, i, users):
+    return 'POST', '/recommend', {'userId': f'user{rng.randrange(users)}', 'sentiment': rng.choice(SENTIMENTS)}
+
+
+def detect_anomalies_request(rng, i, users):
+    return 'POST', '/detect_anomalies', datagen.mood_history(30, seed=rng.random())
+
+
+# A new user per request, so every entry is scored rather than skipped by the cursor
+def incremental_request(rng, i, users):
+    return 'POST', '/detect_anomalies/incremental', {
+        'userId': f'load{i}-{rng.random()}', 'entries': datagen.mood_history(30, seed=rng.random()),
+    }
+
+
+def rollups_daily_request(rng, i, users):
+    return 'GET', f'/rollups/daily?userId=user{rng.randrange(users)}&limit=30', None
+
+
+def rollups_weekly_request(rng, i, users):
+    return 'GET', f'/rollups/weekly?userId=user{rng.randrange(users)}&limit=12', None
+
+
+SCENARIOS = {
+    'analyze': analyze_request,
+    'analyze_batch': analyze_batch_request,
+    'recommend': recommend_request,
+    'detect_anomalies': detect_anomalies_request,
+    'detect_anomalies_incremental': incremental_request,
+    'rollups_daily': rollups_daily_request,
+    'rollups_weekly': rollups_weekly_request,
+}
+
+
+# Fill the local mirror with synthetic journals and recoratings, as a Firestore sync would
+def seed_store(users=200, days=90, ratings_per_user=5, seed=0):
+    from catalog import Catalog
+    from local_store import LocalStore
+
+    store = LocalStore('local_store.db')
+    store.upsert_journals(datagen.journals(users, days, seed=seed, with_text=False))
+    store.upsert_recoratings(list(datagen.recoratings(users, Catalog().titles(), ratings_per_user, seed=seed)))
+    store.connection.close()
+
+
+# Send requests through Flask test clients from concurrency threads, one client per thread.
+# Everything runs in this process, so the numbers include the GIL contention a threaded
+# worker sees but no network or WSGI server overhead.
+def drive(app, requests, concurrency):
+    local = threading.local()
+
+    def send(request):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        method, path, body = request
+        started = time.perf_counter()
+        response = client.open(path, method=method, json=body)
+        size = len(response.get_data())
+        return time.perf_counter() - started, response.status_code, size
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        outcomes = list(pool.map(send, requests))
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _, _ in outcomes)
+    return {
+        'requests': len(outcomes),
+        'concurrency': concurrency,
+        'errors': sum(1 for _, status, _ in outcomes if status >= 400),
+        'seconds': round(elapsed, 3),
+        'rps': round(len(outcomes) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+        'mean_response_bytes': round(sum(size for _, _, size in outcomes) / len(outcomes)),
+    }
+
+
+# Seed the local mirror, build the combined app with everything preloaded and drive each
+# scenario at each concurrency level. Runs in the current directory, where the SQLite files go.
+def run(scenarios=None, concurrency=(1, 4, 16), requests=200, users=200, days=90, seed=0):
+    print(f'Seeding {users} users with {days} days of journals', flush=True)
+    seed_store(users, days, seed=seed)
+
+    from server import create_app
+    app = create_app(preload=True)
+
+    results = {}
+    for name in scenarios or SCENARIOS:
+        build = SCENARIOS[name]
+        for level in concurrency:
+            rng = random.Random(f'{seed}-{name}-{level}')
+            batch = [build(rng, i, users) for i in range(requests)]
+            warmup = [build(rng, requests + i, users) for i in range(min(10, requests))]
+            print(f'Load {name} x{requests} at concurrency {level}', flush=True)
+            drive(app, warmup, level)
+            results[f'load.{name}.c{level}'] = drive(app, batch, level)
+    return results
@@ -0,0 +1,105 @@
+import random
+import warnings
+from benchmarks import datagen
+from benchmarks.timing import measure
+
+
+# polarity_scores of the stock vaderSentiment analyzer next to VaderEngine, on plain and emoji-heavy text
+def bench_polarity_scores(texts=1000, repeat=5, seed=0):
+    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+    from vader_engine import VaderEngine
+
+    analyzer = SentimentIntensityAnalyzer()
+    engine = VaderEngine(analyzer)
+    results = {}
+    for name, emoji_rate in (('plain', 0.0), ('emoji', 0.3)):
+        corpus = datagen.texts(texts, seed=seed, emoji_rate=emoji_rate)
+        results[f'polarity_scores.{name}.vader'] = measure(
+            lambda: [analyzer.polarity_scores(text) for text in corpus], repeat=repeat, per=len(corpus))
+        results[f'polarity_scores.{name}.engine'] = measure(
+            lambda: [engine.polarity_scores(text) for text in corpus], repeat=repeat, per=len(corpus))
+        results[f'polarity_scores.{name}.score_batch'] = measure(
+            lambda: engine.score_batch(corpus), repeat=repeat, per=len(corpus))
+    return results
+
+
+# recommend_items, which rebuilds the pivot table and refits NMF per request,
+# next to RecoModelStore's refit and cached lookups over the same ratings
+def bench_recommend_items(users=1000, ratings_per_user=5, repeat=5, seed=0, reference=True):
+    import pandas as pd
+    from catalog import Catalog
+    from reco import recommend_items
+    from reco_model import RecoModelStore
+    from sklearn.exceptions import ConvergenceWarning
+
+    # NMF warns about convergence on every fit of the synthetic matrix
+    warnings.simplefilter('ignore', ConvergenceWarning)
+    titles = Catalog().titles()
+    rng = random.Random(seed)
+    user_ids = [f'user{rng.randrange(users)}' for _ in range(100)]
+    results = {}
+
+    if reference:
+        df = pd.DataFrame([rec for _, rec in datagen.recoratings(users, titles, ratings_per_user, seed=seed)])
+        results['recommend_items.reference'] = measure(
+            lambda: recommend_items(user_ids[0], titles, df), repeat=repeat)
+        del df
+
+    # The ratings are generated afresh on every refit, only the store holds them in memory
+    store = RecoModelStore(lambda: datagen.recoratings(users, titles, ratings_per_user, seed=seed))
+    results['recommend_items.model_store.refit'] = measure(store.refit, repeat=repeat, warmup=0)
+    allowed = set(titles[: len(titles) // 2])
+    results['recommend_items.model_store.recommend'] = measure(
+        lambda: [store.recommend(user_id, allowed=allowed) for user_id in user_ids],
+        repeat=repeat, per=len(user_ids))
+    new_ratings = [(f'new{i}', {'userId': user_ids[i % len(user_ids)], 'title': titles[i % len(titles)], 'like': True})
+                   for i in range(100)]
+    results['recommend_items.model_store.add_ratings'] = measure(
+        lambda: store.add_ratings([(f'{doc_id}-{rng.random()}', rec) for doc_id, rec in new_ratings]),
+        repeat=repeat, per=len(new_ratings))
+    return results
+
+
+# preprocess_data and detect_anomalies on a posted mood history, next to
+# AnomalyEngine.process scoring the same history one new day at a time
+def bench_anomalies(days=365, repeat=5, seed=0):
+    import tempfile
+    from anomaly import preprocess_data, detect_anomalies
+    from anomaly_engine import AnomalyEngine
+
+    history = datagen.mood_history(days, seed=seed)
+    results = {
+        'preprocess_data': measure(lambda: preprocess_data(history), repeat=repeat),
+        'detect_anomalies': measure(lambda: detect_anomalies(history), repeat=repeat),
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = AnomalyEngine(f'{directory}/anomaly_state.db', load_history=lambda user_id: history)
+        runs = iter(range(1000000))
+
+        def process_history():
+            user_id = f'user{next(runs)}'
+            for i in range(len(history)):
+                engine.process(user_id, history[i:i + 1])
+
+        results['anomaly_engine.process'] = measure(process_history, repeat=repeat, per=len(history))
+        results['anomaly_engine.refit'] = measure(lambda: engine.refit('user0'), repeat=repeat)
+        engine.connection.close()
+    return results
+
+
+# Benchmark groups and the run() options each one takes
+BENCHMARKS = {
+    'polarity_scores': (bench_polarity_scores, ('texts', 'repeat', 'seed')),
+    'recommend_items': (bench_recommend_items, ('users', 'repeat', 'seed', 'reference')),
+    'anomalies': (bench_anomalies, ('days', 'repeat', 'seed')),
+}
+
+
+def run(names=None, **options):
+    results = {}
+    for name in names or BENCHMARKS:
+        bench, accepted = BENCHMARKS[name]
+        print(f'Running {name} micro-benchmarks', flush=True)
+        results.update(bench(**{key: value for key, value in options.items() if key in accepted}))
+    return results
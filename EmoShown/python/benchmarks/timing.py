@@ -0,0 +1,45 @@
+import statistics
+import time
+
+
+# Value at percentile p (0-100) of sorted values, linearly interpolated
+def percentile(values, p):
+    if not values:
+        return None
+    k = (len(values) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (k - lower)
+
+
+# Summary of a list of durations in seconds, reported in milliseconds
+def summarize(durations):
+    durations = sorted(durations)
+    return {
+        'runs': len(durations),
+        'min_ms': round(durations[0] * 1000, 4),
+        'median_ms': round(statistics.median(durations) * 1000, 4),
+        'mean_ms': round(statistics.fmean(durations) * 1000, 4),
+        'p95_ms': round(percentile(durations, 95) * 1000, 4),
+        'max_ms': round(durations[-1] * 1000, 4),
+    }
+
+
+# Call fn() repeat times after warmup untimed calls and summarize the durations.
+# per is the number of operations one call performs, e.g. the number of texts scored,
+# and adds the median time per operation and operations per second.
+def measure(fn, repeat=5, warmup=1, per=1):
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    result = summarize(durations)
+    if per > 1:
+        median = statistics.median(durations)
+        result['ops'] = per
+        result['per_op_ms'] = round(median * 1000 / per, 5)
+        result['ops_per_sec'] = round(per / median, 1) if median else None
+    return result
@@ -0,0 +1,97 @@
+import json
+import os
+import threading
+
+# The catalog shipped with the app
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'JS', 'reco.json')
+
+
+class CatalogItem:
+    __slots__ = ('title', 'description', 'type', 'emotional_impact', 'tags', 'icon')
+
+    def __init__(self, data):
+        self.title = data.get('title')
+        self.description = data.get('description')
+        self.type = data.get('type')
+        self.emotional_impact = tuple(data.get('emotionalImpact') or ())
+        self.tags = tuple(data.get('tags') or ())
+        self.icon = data.get('icon')
+
+    def to_dict(self):
+        return {
+            'title': self.title,
+            'description': self.description,
+            'type': self.type,
+            'emotionalImpact': list(self.emotional_impact),
+            'tags': list(self.tags),
+            'icon': self.icon,
+        }
+
+
+def _index(items, values):
+    index = {}
+    for i, item in enumerate(items):
+        for value in values(item):
+            index.setdefault(value, set()).add(i)
+    return {value: frozenset(positions) for value, positions in index.items()}
+
+
+# One parsed version of reco.json with inverted indexes on emotionalImpact, type and tags
+class CatalogSnapshot:
+    def __init__(self, items, mtime):
+        self.items = tuple(items)
+        self.mtime = mtime
+        self.all = frozenset(range(len(self.items)))
+        self.by_title = {item.title: i for i, item in enumerate(self.items)}
+        self.by_impact = _index(self.items, lambda item: item.emotional_impact)
+        self.by_type = _index(self.items, lambda item: (item.type,) if item.type else ())
+        self.by_tag = _index(self.items, lambda item: item.tags)
+
+    # Positions of the items matching every given filter, in catalog order.
+    # tags matches items carrying any of the given tags.
+    def select(self, sentiment=None, type=None, tags=None, exclude_titles=()):
+        selected = self.all
+        if sentiment is not None:
+            selected = selected & self.by_impact.get(sentiment, frozenset())
+        if type is not None:
+            selected = selected & self.by_type.get(type, frozenset())
+        if tags:
+            selected = selected & frozenset().union(*(self.by_tag.get(tag, frozenset()) for tag in tags))
+        if exclude_titles:
+            selected = selected - {self.by_title[title] for title in exclude_titles if title in self.by_title}
+        return sorted(selected)
+
+
+# Activity/resource catalog loaded from reco.json once and reloaded only when the file changes
+class Catalog:
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.snapshot = None
+
+    def _load(self, mtime):
+        with open(self.path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        # reco.json wraps the items in {"data": [...]}
+        if isinstance(data, dict):
+            data = data.get('data', [])
+        return CatalogSnapshot((CatalogItem(item) for item in data), mtime)
+
+    # Current snapshot, re-read when the file's mtime changed since the last load
+    def current(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        snapshot = self.snapshot
+        if snapshot is None or snapshot.mtime != mtime:
+            with self.lock:
+                if self.snapshot is None or self.snapshot.mtime != mtime:
+                    self.snapshot = self._load(mtime)
+                snapshot = self.snapshot
+        return snapshot
+
+    def items(self, sentiment=None, type=None, tags=None, exclude_titles=()):
+        snapshot = self.current()
+        return [snapshot.items[i] for i in snapshot.select(sentiment, type, tags, exclude_titles)]
+
+    # Titles for sentiment X excluding titles Y, in catalog order
+    def titles(self, sentiment=None, type=None, tags=None, exclude_titles=()):
+        return [item.title for item in self.items(sentiment, type, tags, exclude_titles)]
@@ -0,0 +1,153 @@
+import copy
+import itertools
+from datetime import datetime, timezone
+
+# Sort key of the document id, the same name Firestore uses for FieldPath.document_id()
+DOCUMENT_ID = '__name__'
+
+OPERATORS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+    'in': lambda a, b: a in b,
+    'array_contains': lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+# In-memory stand-in for firebase_admin's Firestore client.
+# It covers the calls the Python services make (collection, document, add, set, where, order_by,
+# start_after, limit, stream) so sync and benchmarks can run without a Firebase project.
+# To test against the real client instead, start the Firestore emulator and set
+# FIRESTORE_EMULATOR_HOST, firebase_admin connects to it automatically.
+class FakeFirestore:
+    def __init__(self):
+        self.collections = {}
+        self.ids = itertools.count(1)
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data, update_time):
+        self.id = doc_id
+        self._data = data
+        self.update_time = update_time
+        self.exists = data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return self._data.get(field)
+
+
+class FakeDocument:
+    def __init__(self, client, collection, doc_id):
+        self.client = client
+        self.collection = collection
+        self.id = doc_id
+
+    def _docs(self):
+        return self.client.collections.setdefault(self.collection, {})
+
+    def set(self, data, merge=False):
+        docs = self._docs()
+        if merge and self.id in docs:
+            data = {**docs[self.id][0], **data}
+        docs[self.id] = (copy.deepcopy(data), datetime.now(timezone.utc))
+
+    def get(self):
+        data, update_time = self._docs().get(self.id, (None, None))
+        return FakeSnapshot(self.id, copy.deepcopy(data), update_time)
+
+    def delete(self):
+        self._docs().pop(self.id, None)
+
+
+class FakeQuery:
+    def __init__(self, client, collection, filters=(), orders=(), cursor=None, count=None):
+        self.client = client
+        self.collection = collection
+        self.filters = list(filters)
+        self.orders = list(orders)
+        self.cursor = cursor
+        self.count = count
+
+    def _copy(self, **changes):
+        query = FakeQuery(self.client, self.collection, self.filters, self.orders, self.cursor, self.count)
+        for key, value in changes.items():
+            setattr(query, key, value)
+        return query
+
+    def where(self, field, op, value):
+        return self._copy(filters=self.filters + [(field, OPERATORS[op], value)])
+
+    def order_by(self, field, direction='ASCENDING'):
+        return self._copy(orders=self.orders + [(field, direction == 'DESCENDING')])
+
+    def start_after(self, values):
+        if isinstance(values, dict):
+            values = [values.get(field) for field, _ in self.orders]
+        values = list(values)
+        # The real client turns a document id cursor into a document path, an empty id is not one
+        for (field, _), value in zip(self.orders, values):
+            if field == DOCUMENT_ID and not value:
+                raise ValueError(f'Invalid document id {value!r} in start_after cursor')
+        return self._copy(cursor=values)
+
+    def limit(self, count):
+        return self._copy(count=count)
+
+    @staticmethod
+    def _value(doc_id, data, field):
+        if field == DOCUMENT_ID:
+            return doc_id
+        return data.get(field)
+
+    def stream(self):
+        docs = self.client.collections.get(self.collection, {})
+        rows = []
+        for doc_id, (data, update_time) in docs.items():
+            matched = True
+            for field, op, value in self.filters:
+                field_value = self._value(doc_id, data, field)
+                # Like Firestore, documents without the field never match a filter on it
+                if field_value is None or not op(field_value, value):
+                    matched = False
+                    break
+            if matched:
+                rows.append((doc_id, data, update_time))
+
+        # Documents missing an ordered field are left out, as Firestore does
+        orders = self.orders + [(DOCUMENT_ID, False)] if self.orders else []
+        rows = [row for row in rows if all(self._value(row[0], row[1], field) is not None for field, _ in orders)]
+        for field, descending in reversed(orders):
+            rows.sort(key=lambda row: self._value(row[0], row[1], field), reverse=descending)
+
+        if self.cursor is not None:
+            def after(row):
+                key = [self._value(row[0], row[1], field) for field, _ in orders[:len(self.cursor)]]
+                return key > self.cursor
+            rows = [row for row in rows if after(row)]
+
+        if self.count is not None:
+            rows = rows[:self.count]
+        for doc_id, data, update_time in rows:
+            yield FakeSnapshot(doc_id, copy.deepcopy(data), update_time)
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, client, name):
+        super().__init__(client, name)
+
+    def document(self, doc_id=None):
+        return FakeDocument(self.client, self.collection, doc_id or f'doc{next(self.client.ids)}')
+
+    def add(self, data):
+        doc = self.document()
+        doc.set(data)
+        return doc.get().update_time, doc
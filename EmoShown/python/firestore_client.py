@@ -0,0 +1,28 @@
+import os
+import threading
+
+# Service account used by every Python service
+CREDENTIALS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'emoshown-firebase-adminsdk.json')
+
+_lock = threading.Lock()
+_client = None
+_pid = None
+
+
+# Firestore client shared by all services in this process.
+# firebase_admin is initialized once; the client itself is created on first use in each process
+# because its gRPC channel pool cannot be shared across fork. Set FIRESTORE_EMULATOR_HOST to
+# point it at a local emulator.
+def get_db():
+    global _client, _pid
+    if _client is None or _pid != os.getpid():
+        with _lock:
+            if _client is None or _pid != os.getpid():
+                import firebase_admin
+                from firebase_admin import credentials, firestore
+
+                if not firebase_admin._apps:
+                    firebase_admin.initialize_app(credentials.Certificate(CREDENTIALS_PATH))
+                _client = firestore.client()
+                _pid = os.getpid()
+    return _client
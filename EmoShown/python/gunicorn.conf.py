@@ -0,0 +1,18 @@
+import multiprocessing
+import os
+
+# Pre-forking production server for all three services: gunicorn -c gunicorn.conf.py
+# gunicorn runs on Linux and macOS only, see server.create_single_process_app for Windows
+wsgi_app = 'wsgi:app'
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('THREADS', 2))
+timeout = 60
+
+# Load the app, lexicons and models once in the master so workers share them copy-on-write
+preload_app = True
+
+
+def post_fork(server, worker):
+    import server as emoshown_server
+    emoshown_server.init_worker()
@@ -0,0 +1,329 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from flask import Blueprint, Response, g, request
+
+bp = Blueprint('instrumentation', __name__)
+
+# Log level of the services, DEBUG adds per-request details
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+
+# Set PROFILING_ENABLED=1 to let a request ask for a sampling profile with the X-Profile header
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '') == '1'
+PROFILE_HEADER = 'X-Profile'
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Directory where the processes of the combined server share their metrics
+METRICS_DIR = os.environ.get('METRICS_DIR', 'metrics')
+
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+# Log records as one JSON object per line, with the fields passed through extra=
+class JsonFormatter(logging.Formatter):
+    STANDARD = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'pid': record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in self.STANDARD:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+_logging_lock = threading.Lock()
+
+
+# Logger under the shared 'emoshown' logger, which writes JSON lines to stderr at LOG_LEVEL
+def get_logger(name):
+    root = logging.getLogger('emoshown')
+    if not root.handlers:
+        with _logging_lock:
+            if not root.handlers:
+                handler = logging.StreamHandler(sys.stderr)
+                handler.setFormatter(JsonFormatter())
+                root.addHandler(handler)
+                root.setLevel(LOG_LEVEL)
+                root.propagate = False
+    return root.getChild(name)
+
+
+log = get_logger('http')
+
+
+# Counters and histograms of this process, rendered in the Prometheus text format.
+# Once shared through a directory, every process (each gunicorn worker and the master) writes a snapshot of
+# its metrics there about once a second, and render() sums the snapshots of all of them with its
+# own live values, so a scrape through any worker reports the whole server. Snapshots of exited
+# workers are kept, so counters never go backwards. Other workers' values can lag by up to
+# flush_interval seconds.
+class Registry:
+    def __init__(self, directory=None, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            # A forked worker starts from zero, the master's counts stay in the master's snapshot
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.dirty = False
+        self.flusher = None
+        self.path = None
+        if self.directory:
+            self.path = os.path.join(self.directory, f'{os.getpid()}-{time.time_ns()}.json')
+
+    def _changed(self):
+        self.dirty = True
+        if self.path is not None and self.flusher is None:
+            self.flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            self.flusher.start()
+
+    def _metric(self, name, kind, help, buckets=None):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = {'kind': kind, 'help': help, 'buckets': buckets, 'series': {}}
+        return metric
+
+    def inc(self, name, help, labels=None, value=1):
+        key = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            series = self._metric(name, 'counter', help)['series']
+            series[key] = series.get(key, 0) + value
+            self._changed()
+
+    def observe(self, name, help, value, labels=None, buckets=DURATION_BUCKETS):
+        key = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            metric = self._metric(name, 'histogram', help, buckets)
+            series = metric['series'].get(key)
+            if series is None:
+                series = metric['series'][key] = {'counts': [0] * len(metric['buckets']), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(metric['buckets']):
+                if value <= bound:
+                    series['counts'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+            self._changed()
+
+    # The metrics as JSON-serializable data, label keys as lists of [name, value] pairs
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: dict(metric, series=[[list(map(list, key)), series] for key, series in metric['series'].items()])
+                for name, metric in self.metrics.items()
+            }
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty or self.path is None:
+                return
+            self.dirty = False
+        data = json.dumps(self.snapshot())
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w') as f:
+            f.write(data)
+        os.replace(temporary, self.path)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                log.exception('Writing the metrics snapshot failed')
+
+    # Snapshots of the other processes sharing the directory
+    def _others(self):
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        snapshots = []
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if not filename.endswith('.json') or path == self.path:
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    # Sum snapshots into {name: metric} with tuple label keys
+    @staticmethod
+    def _merge(snapshots):
+        merged = {}
+        for snapshot in snapshots:
+            for name, metric in snapshot.items():
+                target = merged.setdefault(name, dict(metric, series={}))
+                for pairs, series in metric['series']:
+                    key = tuple(tuple(pair) for pair in pairs)
+                    if metric['kind'] == 'counter':
+                        target['series'][key] = target['series'].get(key, 0) + series
+                        continue
+                    total = target['series'].setdefault(
+                        key, {'counts': [0] * len(metric['buckets']), 'sum': 0.0, 'count': 0})
+                    total['counts'] = [a + b for a, b in zip(total['counts'], series['counts'])]
+                    total['sum'] += series['sum']
+                    total['count'] += series['count']
+        return merged
+
+    @staticmethod
+    def _labels(key, extra=()):
+        pairs = list(key) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+    def render(self):
+        lines = []
+        metrics = self._merge([self.snapshot()] + self._others())
+        for name, metric in sorted(metrics.items()):
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['kind']}")
+            for key, series in sorted(metric['series'].items(), key=lambda item: str(item[0])):
+                if metric['kind'] == 'counter':
+                    lines.append(f'{name}{self._labels(key)} {series}')
+                    continue
+                for bound, count in zip(metric['buckets'], series['counts']):
+                    lines.append(f'{name}_bucket{self._labels(key, [("le", bound)])} {count}')
+                lines.append(f'{name}_bucket{self._labels(key, [("le", "+Inf")])} {series["count"]}')
+                lines.append(f'{name}_sum{self._labels(key)} {series["sum"]}')
+                lines.append(f'{name}_count{self._labels(key)} {series["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    # Share this process's metrics through directory, e.g. before a pre-forking server starts its
+    # workers. Snapshots left there by a previous run are removed, a restart starts from zero.
+    def share(self, directory):
+        if os.path.isdir(directory):
+            for filename in os.listdir(directory):
+                if filename.endswith('.json') or filename.endswith('.tmp'):
+                    os.remove(os.path.join(directory, filename))
+        with self.lock:
+            self.directory = directory
+            self.path = os.path.join(directory, f'{os.getpid()}-{time.time_ns()}.json')
+            if self.metrics:
+                self._changed()
+
+
+registry = Registry()
+
+
+# Time a stage of a request or background job, e.g. with span('reco', 'fit'): ...
+@contextmanager
+def span(service, stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe('emoshown_stage_duration_seconds', 'Time spent in each processing stage.',
+                         time.perf_counter() - started, {'service': service, 'stage': stage})
+
+
+# Samples the stack of one thread at a fixed interval and counts the distinct stacks,
+# written out in the folded format flamegraph.pl and speedscope read
+class SamplingProfiler:
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            folded = ';'.join(reversed(stack))
+            self.stacks[folded] = self.stacks.get(folded, 0) + 1
+            self.samples += 1
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        return self
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]))
+
+
+def _endpoint():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+@bp.before_app_request
+def start_request():
+    g.request_started = time.perf_counter()
+    if PROFILING_ENABLED and request.headers.get(PROFILE_HEADER):
+        g.profiler = SamplingProfiler(threading.get_ident()).start()
+
+
+@bp.after_app_request
+def finish_request(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = _endpoint()
+    labels = {'endpoint': endpoint, 'method': request.method}
+
+    registry.inc('emoshown_requests_total', 'Requests served.', dict(labels, status=response.status_code))
+    if response.status_code >= 400:
+        registry.inc('emoshown_request_errors_total', 'Requests answered with an error status.',
+                     dict(labels, status=response.status_code))
+    registry.observe('emoshown_request_duration_seconds', 'Request handling time.', elapsed, labels)
+    registry.observe('emoshown_request_size_bytes', 'Request body size.', request.content_length or 0,
+                     labels, SIZE_BUCKETS)
+    registry.observe('emoshown_response_size_bytes', 'Response body size.', response.content_length or 0,
+                     labels, SIZE_BUCKETS)
+
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{endpoint.strip('/').replace('/', '_') or 'root'}-"
+                                         f'{int(time.time() * 1000)}-{os.getpid()}.folded')
+        with open(path, 'w') as f:
+            f.write(profiler.folded())
+        response.headers[PROFILE_HEADER] = path
+        log.info('profile written', extra={'endpoint': endpoint, 'samples': profiler.samples, 'path': path})
+
+    log.debug('request', extra={'endpoint': endpoint, 'method': request.method, 'status': response.status_code,
+                                'ms': round(elapsed * 1000, 3)})
+    return response
+
+
+# Metrics of this process, or of every worker of the combined server, in the Prometheus text format
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,341 @@
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from sqlite_connection import SqliteConnection
+from instrumentation import get_logger, span
+import rollups
+
+log = get_logger('local_store')
+
+# Firestore field holding the last write time, set by the app with serverTimestamp()
+UPDATED_FIELD = 'updatedAt'
+
+# Documents pulled from Firestore per page while syncing
+SYNC_PAGE_SIZE = 500
+
+# High-water mark used when none of the copied documents carry updatedAt yet
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS journals (
+    doc_id TEXT PRIMARY KEY,
+    user_id TEXT,
+    day TEXT,
+    date TEXT,
+    emotion TEXT,
+    sentiment REAL,
+    scores TEXT,
+    journal_entry TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS journals_user_day ON journals (user_id, day);
+CREATE INDEX IF NOT EXISTS journals_day ON journals (day);
+
+CREATE TABLE IF NOT EXISTS recoratings (
+    doc_id TEXT PRIMARY KEY,
+    user_id TEXT,
+    title TEXT,
+    "like" INTEGER,
+    type TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS recoratings_user ON recoratings (user_id);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    collection TEXT PRIMARY KEY,
+    high_water TEXT,
+    last_doc_id TEXT,
+    synced_at TEXT
+);
+'''
+
+
+# Journal dates are saved by the app as e.g. 'October 18, 2026'
+def parse_day(date):
+    if not date:
+        return None
+    for fmt in ('%B %d, %Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(str(date).strip(), fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def _timestamp(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _journal_row(doc_id, data):
+    scores = data.get('sentiment')
+    if isinstance(scores, dict):
+        sentiment = scores.get('compound')
+    else:
+        sentiment, scores = scores, None
+    return (
+        doc_id,
+        data.get('userId'),
+        parse_day(data.get('date')),
+        data.get('date'),
+        data.get('emotion'),
+        float(sentiment) if isinstance(sentiment, (int, float)) else None,
+        json.dumps(scores) if scores else None,
+        data.get('journalEntry'),
+        _timestamp(data.get(UPDATED_FIELD)),
+    )
+
+
+def _rating_row(doc_id, data):
+    like = data.get('like')
+    return (
+        doc_id,
+        data.get('userId'),
+        data.get('title'),
+        None if like is None else int(bool(like)),
+        data.get('type'),
+        _timestamp(data.get(UPDATED_FIELD)),
+    )
+
+
+def _rating_doc(row):
+    return {
+        'userId': row['user_id'],
+        'title': row['title'],
+        'like': None if row['like'] is None else bool(row['like']),
+        'type': row['type'],
+    }
+
+
+# Local SQLite mirror of the 'journals' and 'recoratings' collections,
+# indexed by user and day so services read only the slice they need.
+# Daily and weekly per-user rollups of the journals are kept up to date on every upsert.
+class LocalStore:
+    def __init__(self, path='local_store.db'):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = SqliteConnection(path, self._setup)
+
+    def _setup(self, db):
+        db.row_factory = sqlite3.Row
+        if self.path != ':memory:':
+            db.execute('PRAGMA journal_mode=WAL')
+        db.executescript(SCHEMA)
+        db.executescript(rollups.SCHEMA)
+        # Journals mirrored before the rollup tables existed
+        if db.execute('SELECT 1 FROM daily_rollups LIMIT 1').fetchone() is None:
+            rollups.rebuild(db)
+        db.commit()
+
+    @property
+    def db(self):
+        return self.connection.get()
+
+    def upsert_journals(self, docs):
+        rows = [_journal_row(doc_id, data) for doc_id, data in docs]
+        with self.lock:
+            db = self.db
+            # Days the entries were on before and after this write both need their rollups refreshed
+            touched = {(row[1], row[2]) for row in rows}
+            for start in range(0, len(rows), 500):
+                ids = [row[0] for row in rows[start:start + 500]]
+                touched.update(tuple(old) for old in db.execute(
+                    f"SELECT user_id, day FROM journals WHERE doc_id IN ({', '.join('?' * len(ids))})", ids
+                ))
+            db.executemany('INSERT OR REPLACE INTO journals VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            rollups.refresh(db, touched)
+            db.commit()
+        return len(rows)
+
+    def upsert_recoratings(self, docs):
+        rows = [_rating_row(doc_id, data) for doc_id, data in docs]
+        with self.lock:
+            self.db.executemany('INSERT OR REPLACE INTO recoratings VALUES (?, ?, ?, ?, ?, ?)', rows)
+            self.db.commit()
+        return len(rows)
+
+    # Journals as dicts with the fields the services use, optionally for one user and a day window
+    # (start and end are inclusive 'YYYY-MM-DD' strings)
+    def journals(self, user_id=None, start=None, end=None):
+        clauses, params = [], []
+        if user_id is not None:
+            clauses.append('user_id = ?')
+            params.append(user_id)
+        if start is not None:
+            clauses.append('day >= ?')
+            params.append(start)
+        if end is not None:
+            clauses.append('day <= ?')
+            params.append(end)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+        with self.lock:
+            rows = self.db.execute(
+                f'SELECT doc_id, user_id, day, date, emotion, sentiment, journal_entry FROM journals{where} '
+                'ORDER BY day, doc_id', params
+            ).fetchall()
+        return [
+            {
+                'id': row['doc_id'],
+                'userId': row['user_id'],
+                'day': row['day'],
+                'date': row['date'],
+                'emotion': row['emotion'],
+                'sentiment': row['sentiment'],
+                'journalEntry': row['journal_entry'],
+            }
+            for row in rows
+        ]
+
+    # One page of a user's 'daily' or 'weekly' rollups and the cursor of the next page
+    def rollups(self, period, user_id, cursor=None, limit=30, descending=True, start=None, end=None):
+        with self.lock:
+            return rollups.page(self.db, period, user_id, cursor, limit, descending, start, end)
+
+    # Ratings as (document id, recoratings document) pairs, optionally for one user
+    def recoratings(self, user_id=None):
+        query = 'SELECT doc_id, user_id, title, "like", type FROM recoratings'
+        params = []
+        if user_id is not None:
+            query += ' WHERE user_id = ?'
+            params.append(user_id)
+        with self.lock:
+            rows = self.db.execute(query, params).fetchall()
+        return [(row['doc_id'], _rating_doc(row)) for row in rows]
+
+    # Ratings written since marker, for processes that only read the mirror.
+    # The marker is the largest rowid seen; INSERT OR REPLACE gives a rewritten row a new rowid,
+    # so updates show up as well. Returns the new marker and (document id, document) pairs,
+    # with marker None only the current marker.
+    def recoratings_changes(self, marker=None):
+        with self.lock:
+            if marker is None:
+                return self.db.execute('SELECT COALESCE(MAX(rowid), 0) FROM recoratings').fetchone()[0], []
+            rows = self.db.execute(
+                'SELECT rowid, doc_id, user_id, title, "like", type FROM recoratings WHERE rowid > ? ORDER BY rowid',
+                (marker,),
+            ).fetchall()
+        return (rows[-1]['rowid'] if rows else marker), [(row['doc_id'], _rating_doc(row)) for row in rows]
+
+    def sync_state(self, collection):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT high_water, last_doc_id FROM sync_state WHERE collection = ?', (collection,)
+            ).fetchone()
+        return (row['high_water'], row['last_doc_id']) if row else (None, None)
+
+    def set_sync_state(self, collection, high_water, last_doc_id):
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)',
+                (collection, high_water, last_doc_id, datetime.now().isoformat()),
+            )
+            self.db.commit()
+
+
+# Pulls changed documents from Firestore into a LocalStore.
+# The first sync of a collection copies every document, page by page in document id order.
+# After that only documents whose updatedAt is past the stored high-water mark are read, also paged.
+# Deleted documents are not detected. client can be firebase_admin's Firestore client
+# (pointed at the emulator through FIRESTORE_EMULATOR_HOST if needed) or a FakeFirestore.
+class FirestoreSync:
+    COLLECTIONS = {
+        'journals': LocalStore.upsert_journals,
+        'recoratings': LocalStore.upsert_recoratings,
+    }
+
+    def __init__(self, client, store, collections=None, page_size=SYNC_PAGE_SIZE):
+        self.client = client
+        self.store = store
+        self.collections = collections or list(self.COLLECTIONS)
+        self.page_size = page_size
+        self.thread = None
+        self.synced = threading.Event()
+        self.stopped = threading.Event()
+
+    # Copy every document page by page in document id order, upserting each page as it arrives
+    def _full_copy(self, collection, upsert):
+        count, last_doc_id, high_water = 0, None, (EPOCH, '')
+        while True:
+            query = self.client.collection(collection).order_by('__name__')
+            if last_doc_id:
+                query = query.start_after([last_doc_id])
+            query = query.limit(self.page_size)
+            with span('sync', 'firestore_fetch'):
+                docs = [(doc.id, doc.to_dict()) for doc in query.stream()]
+            if not docs:
+                break
+            with span('sync', 'upsert'):
+                upsert(self.store, docs)
+            count += len(docs)
+            last_doc_id = docs[-1][0]
+            stamped = [(data[UPDATED_FIELD], doc_id) for doc_id, data in docs if data.get(UPDATED_FIELD) is not None]
+            high_water = max(stamped + [high_water])
+            if len(docs) < self.page_size:
+                break
+        return high_water, count
+
+    def _changes(self, collection, upsert, high_water, last_doc_id):
+        count = 0
+        while True:
+            query = self.client.collection(collection) \
+                .where(UPDATED_FIELD, '>=', high_water) \
+                .order_by(UPDATED_FIELD) \
+                .order_by('__name__')
+            # After a full copy of unstamped documents there is no document to start after,
+            # an empty id is not a valid cursor so the first page starts at the high-water mark
+            if last_doc_id:
+                query = query.start_after([high_water, last_doc_id])
+            query = query.limit(self.page_size)
+            with span('sync', 'firestore_fetch'):
+                docs = [(doc.id, doc.to_dict()) for doc in query.stream()]
+            if not docs:
+                break
+            with span('sync', 'upsert'):
+                upsert(self.store, docs)
+            count += len(docs)
+            last_doc_id, data = docs[-1]
+            high_water = data[UPDATED_FIELD]
+            if len(docs) < self.page_size:
+                break
+        return (high_water, last_doc_id), count
+
+    # Sync one collection, returns the number of documents written locally
+    def sync_collection(self, collection):
+        upsert = self.COLLECTIONS[collection]
+        high_water, last_doc_id = self.store.sync_state(collection)
+        if high_water is None:
+            (high_water, last_doc_id), count = self._full_copy(collection, upsert)
+        else:
+            (high_water, last_doc_id), count = self._changes(
+                collection, upsert, datetime.fromisoformat(high_water), last_doc_id or ''
+            )
+        self.store.set_sync_state(collection, _timestamp(high_water), last_doc_id)
+        return count
+
+    def sync(self):
+        counts = {collection: self.sync_collection(collection) for collection in self.collections}
+        log.debug('Firestore sync', extra={'documents': counts})
+        return counts
+
+    def _run(self, interval):
+        while True:
+            try:
+                self.sync()
+                self.synced.set()
+            except Exception:
+                log.exception('Firestore sync failed')
+            if self.stopped.wait(interval):
+                break
+
+    # Sync now and then every interval seconds in a background thread; synced is set after the first sync
+    def start(self, interval=60):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, args=(interval,), name='firestore-sync', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
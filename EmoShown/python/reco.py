@@ -1,87 +1,144 @@
-from flask import Flask, request, jsonify
+import os
+import threading
+from flask import Blueprint, Flask, request, jsonify
 from flask_cors import CORS
-import numpy as np
-import pandas as pd
-from sklearn.decomposition import NMF
-import firebase_admin
-from firebase_admin import credentials, firestore
-import json
+from firestore_client import get_db
+from catalog import Catalog
+from local_store import LocalStore, FirestoreSync
+from instrumentation import get_logger, span
+import instrumentation
 
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
+bp = Blueprint('reco', __name__)
+
+log = get_logger('reco')
+
+# Local mirror of the recoratings collection, kept up to date with incremental syncs
+local_store = LocalStore('local_store.db')
 
-# Initialize Firebase
-cred = credentials.Certificate('emoshown-firebase-adminsdk.json')
-firebase_admin.initialize_app(cred)
-db = firestore.client()
-
-# Function to load data from reco.json
-def load_reco_json():
-    with open('reco.json', 'r') as file:
-        return pd.DataFrame(json.load(file))
-
-# Function to get data from Firebase
-def get_recoratings_data():
-    recoratings_ref = db.collection('recoratings').stream()
-    recoratings = []
-    for rec in recoratings_ref:
-        rec_data = rec.to_dict()
-        recoratings.append(rec_data)
-    return pd.DataFrame(recoratings)
+# Activities/resources from reco.json, indexed once and reloaded when the file changes
+catalog = Catalog()
+
+# Where the refitting process saves the model for the other workers to load
+RECO_MODEL_PATH = os.environ.get('RECO_MODEL_PATH', 'reco_model.pkl')
+
+# Function to get (document id, data) pairs from the local mirror, optionally for one user
+def fetch_recoratings(user_id=None):
+    with span('reco', 'fetch'):
+        return local_store.recoratings(user_id)
 
 # Collaborative Filtering using Matrix Factorization
-def recommend_items(user_id, activities_resources, recoratings_df):
+def recommend_items(user_id, candidate_titles, recoratings_df):
+    import numpy as np
+    import pandas as pd
+    from sklearn.decomposition import NMF
+
     # Create a user-item matrix
-    user_item_matrix = recoratings_df.pivot_table(index='userId', columns='title', values='like').fillna(0)
+    with span('reco', 'pivot'):
+        user_item_matrix = recoratings_df.pivot_table(index='userId', columns='title', values='like').fillna(0)
 
     # Check if user has existing ratings
     if user_id in user_item_matrix.index:
-        nmf = NMF(n_components=5, init='random', random_state=42)
-        user_matrix = nmf.fit_transform(user_item_matrix)
-        item_matrix = nmf.components_
-
-        # Predicted ratings
-        predicted_ratings = np.dot(user_matrix, item_matrix)
-        user_ratings = pd.Series(predicted_ratings[user_item_matrix.index.get_loc(user_id)], index=user_item_matrix.columns)
-        user_ratings = user_ratings.sort_values(ascending=False)
-
-        # Filter out items already rated by the user
-        unrated_items = user_ratings[user_item_matrix.loc[user_id] == 0]
-        recommendations = unrated_items.index.tolist()
+        with span('reco', 'fit'):
+            nmf = NMF(n_components=5, init='random', random_state=42)
+            user_matrix = nmf.fit_transform(user_item_matrix)
+            item_matrix = nmf.components_
+
+        with span('reco', 'predict'):
+            # Predicted ratings
+            predicted_ratings = np.dot(user_matrix, item_matrix)
+            user_ratings = pd.Series(predicted_ratings[user_item_matrix.index.get_loc(user_id)], index=user_item_matrix.columns)
+            user_ratings = user_ratings.sort_values(ascending=False)
+
+            # Filter out items already rated by the user
+            unrated_items = user_ratings[user_item_matrix.loc[user_id] == 0]
+            recommendations = unrated_items.index.tolist()
     else:
-        recommendations = activities_resources['title'].tolist()
+        recommendations = list(candidate_titles)
 
     return recommendations[:10]
 
+_lock = threading.Lock()
+_model_store = None
+
+# Recommendation model kept in memory, refit hourly or after 100 new ratings.
+# Created on first use so numpy/scipy/sklearn are only imported when needed.
+def get_model_store():
+    global _model_store
+    if _model_store is None:
+        with _lock:
+            if _model_store is None:
+                from reco_model import RecoModelStore
+                _model_store = RecoModelStore(fetch_recoratings, refit_interval=3600, refit_after=100,
+                                              load_changes=local_store.recoratings_changes,
+                                              model_path=RECO_MODEL_PATH)
+    return _model_store
+
+# Load the catalog and the saved model, or fit one from the local mirror, without touching Firestore
+def preload():
+    catalog.current()
+    model_store = get_model_store()
+    if model_store.model is None and not model_store.reload():
+        model_store.refit()
+
+# Follow the model the background process refits, in every worker
+def start_worker():
+    get_model_store().follow(interval=10)
+
+# Start the Firestore sync and the refit thread; run in one process only. The sync picks up
+# new ratings every 10 seconds, the workers fold them into their models from the mirror.
+# Nothing here blocks, the model is (re)fitted once the first sync has finished.
+def start_background():
+    firestore_sync = FirestoreSync(get_db(), local_store, collections=['recoratings'])
+    firestore_sync.start(interval=10)
+
+    def start_model():
+        firestore_sync.synced.wait(timeout=120)
+        get_model_store().start()
+
+    threading.Thread(target=start_model, name='reco-model-start', daemon=True).start()
+
 # API to get recommendations
-@app.route('/recommend', methods=['POST'])
+@bp.route('/recommend', methods=['POST'])
 def recommend():
     try:
         data = request.json
         user_id = data.get('userId')
         sentiment = data.get('sentiment')
 
-        print("Received user ID:", user_id)
-        print("Received sentiment:", sentiment)  # Log sentiment
-
-        # Load activities/resources from reco.json
-        activities_resources = load_reco_json()
+        log.debug('Recommendation request', extra={'user_id': user_id, 'sentiment': sentiment})
 
-        # Optionally, filter activities_resources based on sentiment
-        # (assuming your reco.json has a structure with emotionalImpact)
-        activities_resources = activities_resources[activities_resources['emotionalImpact'].apply(lambda x: sentiment in x)]
+        # Activities/resources whose emotionalImpact matches the sentiment
+        with span('reco', 'candidates'):
+            candidates = catalog.titles(sentiment)
 
-        # Get recoratings data
-        recoratings_df = get_recoratings_data()
+        # Get recommendations from the cached model, users without ratings get the matching activities
+        with span('reco', 'predict'):
+            recommendations = get_model_store().recommend(user_id, allowed=set(candidates))
+        if recommendations is None:
+            recommendations = candidates[:10]
+        elif len(recommendations) < 10:
+            # Top up with matching activities the user has not rated, e.g. ones added since the last refit
+            rated = {rec['title'] for _, rec in fetch_recoratings(user_id)}
+            recommendations += catalog.titles(sentiment, exclude_titles=rated.union(recommendations))[:10 - len(recommendations)]
 
-        # Get recommendations
-        recommendations = recommend_items(user_id, activities_resources, recoratings_df)
-
-        return jsonify({"recommendations": recommendations})
+        with span('reco', 'serialize'):
+            return jsonify({"recommendations": recommendations})
 
     except Exception as e:
-        print("Error:", str(e))
+        log.exception('Recommendation failed')
         return jsonify({"error": str(e)}), 500
 
+# Model store counters
+@bp.route('/recommend/model', methods=['GET'])
+def recommend_model_stats():
+    return jsonify(get_model_store().stats())
+
+app = Flask(__name__)
+CORS(app, resources={r"/*": {"origins": "*"}})
+app.register_blueprint(bp)
+app.register_blueprint(instrumentation.bp)
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    start_worker()
+    start_background()
+    app.run(debug=True, use_reloader=False)
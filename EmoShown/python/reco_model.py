@@ -0,0 +1,314 @@
+import os
+import pickle
+import threading
+import time
+import numpy as np
+from scipy.optimize import nnls
+from scipy.sparse import csr_matrix
+from sklearn.decomposition import NMF
+from instrumentation import get_logger, span
+
+log = get_logger('reco_model')
+
+# Number of ranked unrated items cached per user
+TOP_N = 50
+
+# Users scored per block when ranking, bounds the size of the dense prediction block
+RANK_BLOCK_SIZE = 10000
+
+
+# Turn a recoratings document into (userId, title, like) or None when it is incomplete
+def parse_rating(rec):
+    user_id = rec.get('userId')
+    title = rec.get('title')
+    if user_id is None or title is None:
+        return None
+    like = rec.get('like')
+    return user_id, title, float(like) if like is not None else 0.0
+
+
+# A fitted snapshot of the recommendation model
+class RecoModel:
+    def __init__(self, users, items, matrix, user_factors, item_factors, top_items):
+        self.users = users
+        self.items = items
+        self.user_index = {user: i for i, user in enumerate(users)}
+        self.item_index = {item: i for i, item in enumerate(items)}
+        self.matrix = matrix
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        self.top_items = top_items
+
+
+# Rank every item for a block of users, leaving out the items they already rated
+def rank_unrated(predicted, rated_rows, items, top_n):
+    order = np.argsort(-predicted, axis=1, kind='stable')
+    ranked = []
+    for row, rated in zip(order, rated_rows):
+        ranked.append([items[j] for j in row if j not in rated][:top_n])
+    return ranked
+
+
+# Keeps the user-item matrix and a fitted NMF model in memory.
+# The model is refit from the full ratings collection in the background, either on a schedule
+# or after a number of new ratings. In between, new ratings are folded in by solving only the
+# rater's latent row against the fixed item factors, and every user's top unrated items are
+# precomputed so a recommendation is a dictionary lookup.
+# With model_path set, the process that refits saves each model there and the other processes
+# only follow: they reload the file when it changes and fold in the ratings load_changes reports.
+class RecoModelStore:
+    def __init__(self, load_ratings, n_components=5, top_n=TOP_N, refit_interval=3600, refit_after=100,
+                 load_changes=None, model_path=None):
+        # load_ratings returns an iterable of (document id, recoratings document)
+        self.load_ratings = load_ratings
+        # load_changes(marker) returns the next marker and the ratings written since marker,
+        # load_changes(None) only the current marker
+        self.load_changes = load_changes
+        self.model_path = model_path
+        self.n_components = n_components
+        self.top_n = top_n
+        self.refit_interval = refit_interval
+        self.refit_after = refit_after
+
+        self.lock = threading.RLock()
+        self.refit_requested = threading.Event()
+        self.thread = None
+        self.follower = None
+
+        self.ratings = {}       # document id -> (userId, title, like)
+        self.user_docs = {}     # userId -> set of document ids
+        self.recent = {}        # ratings added since the running refit loaded its data
+        self.folded = {}        # userId -> top items for users folded in since the last refit
+        self.model = None
+        self.pending = 0
+        self.last_refit = None
+        self.last_refit_seconds = None
+        self.marker = None
+        self.model_mtime = None
+
+    def _index_ratings(self, ratings):
+        user_docs = {}
+        for doc_id, (user_id, _, _) in ratings.items():
+            user_docs.setdefault(user_id, set()).add(doc_id)
+        return user_docs
+
+    # Mean like per (user, title), the same aggregation pivot_table applied
+    def _user_row(self, user_id, ratings, user_docs):
+        sums = {}
+        for doc_id in user_docs.get(user_id, ()):
+            _, title, like = ratings[doc_id]
+            total, count = sums.get(title, (0.0, 0))
+            sums[title] = (total + like, count + 1)
+        return {title: total / count for title, (total, count) in sums.items()}
+
+    def _fit(self, ratings):
+        user_docs = self._index_ratings(ratings)
+        users = sorted(user_docs)
+        items = sorted({title for _, title, _ in ratings.values()})
+        if not users or not items:
+            return None
+        item_index = {item: i for i, item in enumerate(items)}
+
+        rows, cols, values = [], [], []
+        for i, user_id in enumerate(users):
+            for title, like in self._user_row(user_id, ratings, user_docs).items():
+                rows.append(i)
+                cols.append(item_index[title])
+                values.append(like)
+        matrix = csr_matrix((values, (rows, cols)), shape=(len(users), len(items)), dtype=np.float64)
+        matrix.eliminate_zeros()
+
+        nmf = NMF(n_components=self.n_components, init='random', random_state=42)
+        user_factors = nmf.fit_transform(matrix)
+        item_factors = nmf.components_
+
+        top_items = {}
+        for start in range(0, len(users), RANK_BLOCK_SIZE):
+            stop = min(start + RANK_BLOCK_SIZE, len(users))
+            predicted = user_factors[start:stop] @ item_factors
+            rated_rows = [set(matrix.indices[matrix.indptr[i]:matrix.indptr[i + 1]]) for i in range(start, stop)]
+            for user_id, ranked in zip(users[start:stop], rank_unrated(predicted, rated_rows, items, self.top_n)):
+                top_items[user_id] = ranked
+
+        return RecoModel(users, items, matrix, user_factors, item_factors, top_items)
+
+    # Solve the user's latent row against the fixed item factors and re-rank their items
+    def _fold_in(self, user_id):
+        model = self.model
+        if model is None:
+            return
+        row = np.zeros(len(model.items))
+        for title, like in self._user_row(user_id, self.ratings, self.user_docs).items():
+            j = model.item_index.get(title)
+            if j is not None:
+                row[j] = like
+        user_factor, _ = nnls(model.item_factors.T, row)
+        predicted = (user_factor @ model.item_factors)[np.newaxis, :]
+        rated = set(np.flatnonzero(row))
+        self.folded[user_id] = rank_unrated(predicted, [rated], model.items, self.top_n)[0]
+
+    # Write the model and the ratings it was fitted on, replacing the file in one step
+    def _save(self, model, ratings, marker, fitted_at, seconds):
+        temporary = f'{self.model_path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as f:
+            pickle.dump({'model': model, 'ratings': ratings, 'marker': marker,
+                         'last_refit': fitted_at, 'last_refit_seconds': seconds}, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, self.model_path)
+        return os.stat(self.model_path).st_mtime_ns
+
+    # Rebuild the matrix and refit the model from the full ratings collection
+    def refit(self):
+        started = time.time()
+        with self.lock:
+            self.recent = {}
+        # Taken before reading, so ratings written meanwhile are reported again and folded in
+        marker = self.load_changes(None)[0] if self.load_changes is not None else None
+        ratings = {}
+        for doc_id, rec in self.load_ratings():
+            rating = parse_rating(rec)
+            if rating is not None:
+                ratings[doc_id] = rating
+        with span('reco', 'refit'):
+            model = self._fit(ratings)
+        fitted_at = time.time()
+        seconds = round(fitted_at - started, 3)
+        mtime = self._save(model, ratings, marker, fitted_at, seconds) if self.model_path else None
+
+        with self.lock:
+            # Ratings that arrived while fitting are kept and folded into the new model
+            ratings.update(self.recent)
+            self.ratings = ratings
+            self.user_docs = self._index_ratings(ratings)
+            self.model = model
+            self.folded = {}
+            for user_id in {user_id for user_id, _, _ in self.recent.values()}:
+                self._fold_in(user_id)
+            self.recent = {}
+            self.pending = 0
+            self.marker = marker
+            self.model_mtime = mtime
+            self.last_refit = fitted_at
+            self.last_refit_seconds = seconds
+        log.info('Model refit', extra={'ratings': len(ratings), 'seconds': seconds})
+
+    # Load the model saved by the refitting process if the file changed, returns whether it did
+    def reload(self):
+        if not self.model_path:
+            return False
+        try:
+            mtime = os.stat(self.model_path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self.model_mtime:
+            return False
+        with open(self.model_path, 'rb') as f:
+            saved = pickle.load(f)
+        with self.lock:
+            self.ratings = saved['ratings']
+            self.user_docs = self._index_ratings(self.ratings)
+            self.model = saved['model']
+            self.folded = {}
+            # The saved model covers everything up to its marker, later ratings are polled again
+            self.recent = {}
+            self.pending = 0
+            self.marker = saved['marker']
+            self.model_mtime = mtime
+            self.last_refit = saved['last_refit']
+            self.last_refit_seconds = saved['last_refit_seconds']
+        return True
+
+    # Fold in the ratings written since the last poll, returns how many were read
+    def poll(self):
+        if self.load_changes is None or self.marker is None:
+            return 0
+        marker, docs = self.load_changes(self.marker)
+        if docs:
+            self.add_ratings(docs)
+        with self.lock:
+            self.marker = marker
+        return len(docs)
+
+    # Add new ratings given as (document id, recoratings document) pairs
+    def add_ratings(self, docs):
+        with self.lock:
+            users = set()
+            for doc_id, rec in docs:
+                rating = parse_rating(rec)
+                if rating is None or self.ratings.get(doc_id) == rating:
+                    continue
+                previous = self.ratings.get(doc_id)
+                if previous is not None:
+                    self.user_docs[previous[0]].discard(doc_id)
+                self.ratings[doc_id] = rating
+                self.recent[doc_id] = rating
+                self.user_docs.setdefault(rating[0], set()).add(doc_id)
+                users.add(rating[0])
+                self.pending += 1
+            with span('reco', 'fold_in'):
+                for user_id in users:
+                    self._fold_in(user_id)
+            if self.refit_after and self.pending >= self.refit_after:
+                self.refit_requested.set()
+
+    # Cached ranking of unrated items for a user, or None when the user has no ratings.
+    # allowed limits the result to a set of titles, e.g. the ones matching the user's sentiment.
+    def recommend(self, user_id, allowed=None, limit=10):
+        with self.lock:
+            ranked = self.folded.get(user_id)
+            if ranked is None and self.model is not None:
+                ranked = self.model.top_items.get(user_id)
+        if ranked is None:
+            return None
+        if allowed is not None:
+            ranked = [title for title in ranked if title in allowed]
+        return ranked[:limit]
+
+    def _run(self):
+        while True:
+            self.refit_requested.wait(self.refit_interval)
+            self.refit_requested.clear()
+            try:
+                self.refit()
+            except Exception:
+                log.exception('Model refit failed')
+
+    def _follow(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.reload()
+                self.poll()
+            except Exception:
+                log.exception('Model reload failed')
+
+    # Reload refitted models and fold in new ratings every interval seconds, in every process
+    def follow(self, interval=10):
+        if self.follower is None:
+            self.follower = threading.Thread(target=self._follow, args=(interval,), name='reco-model-follow',
+                                             daemon=True)
+            self.follower.start()
+
+    # Fit the first model unless one was preloaded, and keep refitting it in a background thread.
+    # Only one process should call this, the others follow the saved model.
+    def start(self):
+        if self.model is None:
+            try:
+                self.refit()
+            except Exception:
+                log.exception('Initial model fit failed')
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='reco-model-refit', daemon=True)
+            self.thread.start()
+
+    def stats(self):
+        with self.lock:
+            model = self.model
+            return {
+                'users': len(model.users) if model else 0,
+                'items': len(model.items) if model else 0,
+                'ratings': len(self.ratings),
+                'pending': self.pending,
+                'folded_users': len(self.folded),
+                'last_refit': self.last_refit,
+                'last_refit_seconds': self.last_refit_seconds,
+            }
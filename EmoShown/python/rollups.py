@@ -0,0 +1,129 @@
+import json
+from datetime import date, timedelta
+
+# Largest page served by the rollup queries
+MAX_PAGE_SIZE = 366
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    entries INTEGER NOT NULL,
+    sentiment_sum REAL NOT NULL,
+    sentiment_count INTEGER NOT NULL,
+    emotions TEXT NOT NULL,
+    PRIMARY KEY (user_id, day)
+);
+
+CREATE TABLE IF NOT EXISTS weekly_rollups (
+    user_id TEXT NOT NULL,
+    week TEXT NOT NULL,
+    entries INTEGER NOT NULL,
+    sentiment_sum REAL NOT NULL,
+    sentiment_count INTEGER NOT NULL,
+    emotions TEXT NOT NULL,
+    PRIMARY KEY (user_id, week)
+);
+'''
+
+# Period column of each rollup table
+PERIODS = {'daily': ('daily_rollups', 'day'), 'weekly': ('weekly_rollups', 'week')}
+
+
+# Monday of the ISO week containing day, both 'YYYY-MM-DD'
+def week_start(day):
+    parsed = date.fromisoformat(day)
+    return (parsed - timedelta(days=parsed.weekday())).isoformat()
+
+
+def _aggregate(rows):
+    entries, sentiment_sum, sentiment_count, emotions = 0, 0.0, 0, {}
+    for row_entries, row_sum, row_count, row_emotions in rows:
+        entries += row_entries
+        sentiment_sum += row_sum
+        sentiment_count += row_count
+        for emotion, count in row_emotions.items():
+            emotions[emotion] = emotions.get(emotion, 0) + count
+    return entries, sentiment_sum, sentiment_count, emotions
+
+
+def _write(db, table, period, user_id, key, aggregate):
+    entries, sentiment_sum, sentiment_count, emotions = aggregate
+    if entries == 0:
+        db.execute(f'DELETE FROM {table} WHERE user_id = ? AND {period} = ?', (user_id, key))
+    else:
+        db.execute(
+            f'INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?, ?)',
+            (user_id, key, entries, sentiment_sum, sentiment_count, json.dumps(emotions, sort_keys=True)),
+        )
+
+
+# Recompute the daily rollups of the given (user_id, day) pairs from the journals table,
+# then the weekly rollups of the weeks they fall in. Called inside the journal upsert transaction.
+def refresh(db, touched):
+    weeks = set()
+    for user_id, day in touched:
+        if user_id is None or day is None:
+            continue
+        rows = db.execute('SELECT emotion, sentiment FROM journals WHERE user_id = ? AND day = ?', (user_id, day))
+        entries, sentiment_sum, sentiment_count, emotions = 0, 0.0, 0, {}
+        for emotion, sentiment in rows:
+            entries += 1
+            if sentiment is not None:
+                sentiment_sum += sentiment
+                sentiment_count += 1
+            if emotion:
+                emotions[emotion] = emotions.get(emotion, 0) + 1
+        _write(db, 'daily_rollups', 'day', user_id, day, (entries, sentiment_sum, sentiment_count, emotions))
+        weeks.add((user_id, week_start(day)))
+
+    for user_id, week in weeks:
+        end = (date.fromisoformat(week) + timedelta(days=6)).isoformat()
+        rows = db.execute(
+            'SELECT entries, sentiment_sum, sentiment_count, emotions FROM daily_rollups '
+            'WHERE user_id = ? AND day BETWEEN ? AND ?', (user_id, week, end)
+        )
+        aggregate = _aggregate((entries, total, count, json.loads(emotions)) for entries, total, count, emotions in rows)
+        _write(db, 'weekly_rollups', 'week', user_id, week, aggregate)
+
+
+# Rebuild every rollup from the journals table, e.g. for journals mirrored before rollups existed
+def rebuild(db):
+    db.execute('DELETE FROM daily_rollups')
+    db.execute('DELETE FROM weekly_rollups')
+    touched = db.execute('SELECT DISTINCT user_id, day FROM journals WHERE day IS NOT NULL').fetchall()
+    refresh(db, [(user_id, day) for user_id, day in touched])
+
+
+# One page of a user's rollups, newest first unless descending is False.
+# cursor is the last period of the previous page; returns the items and the cursor of the next page.
+def page(db, period, user_id, cursor=None, limit=30, descending=True, start=None, end=None):
+    table, column = PERIODS[period]
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    clauses, params = ['user_id = ?'], [user_id]
+    if cursor is not None:
+        clauses.append(f'{column} < ?' if descending else f'{column} > ?')
+        params.append(cursor)
+    if start is not None:
+        clauses.append(f'{column} >= ?')
+        params.append(start)
+    if end is not None:
+        clauses.append(f'{column} <= ?')
+        params.append(end)
+    rows = db.execute(
+        f'SELECT {column}, entries, sentiment_sum, sentiment_count, emotions FROM {table} '
+        f"WHERE {' AND '.join(clauses)} ORDER BY {column} {'DESC' if descending else 'ASC'} LIMIT ?",
+        params + [limit + 1],
+    ).fetchall()
+
+    items = [
+        {
+            column: key,
+            'entries': entries,
+            'meanSentiment': round(sentiment_sum / sentiment_count, 4) if sentiment_count else None,
+            'emotions': json.loads(emotions),
+        }
+        for key, entries, sentiment_sum, sentiment_count, emotions in rows[:limit]
+    ]
+    next_cursor = items[-1][column] if len(rows) > limit else None
+    return items, next_cursor
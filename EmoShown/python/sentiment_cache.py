@@ -0,0 +1,163 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from sqlite_connection import SqliteConnection
+
+# Milliseconds a disk lookup or write waits for another worker's lock before giving up,
+# a busy disk tier falls back to computing the scores rather than stalling the request
+DISK_BUSY_TIMEOUT = 100
+
+
+# Version stamp of the lexicons an analyzer was built from.
+# SentimentIntensityAnalyzer keeps the raw file contents in lexicon_full_filepath/emoji_full_filepath,
+# so swapping vader_lexicon.txt (or the emoji lexicon) changes the stamp.
+def lexicon_version(analyzer):
+    digest = hashlib.sha256()
+    digest.update(analyzer.lexicon_full_filepath.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(analyzer.emoji_full_filepath.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+# Normalize the combined text the same way for every lookup; VADER tokenizes on whitespace
+# so runs of whitespace do not change the scores. Case is kept, VADER boosts ALL-CAPS words.
+def normalize_text(text):
+    return ' '.join(text.split())
+
+
+def text_key(text):
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+# Content-addressed cache of sentiment scores.
+# A bounded in-memory LRU sits in front of an optional SQLite file that survives restarts.
+# Every entry is stamped with the lexicon version it was computed with, entries from another
+# version are treated as misses and dropped. Errors from the SQLite file (e.g. another worker
+# holding the lock) are counted and the cache carries on in memory only for that call.
+class SentimentCache:
+    def __init__(self, version, max_size=10000, db_path=None):
+        self.version = version
+        self.max_size = max_size
+        self.db_path = db_path
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale = 0
+        self.disk_errors = 0
+
+        self.connection = SqliteConnection(db_path, self._setup) if db_path else None
+
+    def _setup(self, db):
+        # WAL lets readers in every worker proceed while one of them writes
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute(f'PRAGMA busy_timeout = {DISK_BUSY_TIMEOUT}')
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS sentiment_cache ('
+            'key TEXT PRIMARY KEY, version TEXT NOT NULL, scores TEXT NOT NULL)'
+        )
+        # Results computed with another lexicon can never be served again
+        self.stale += db.execute(
+            'DELETE FROM sentiment_cache WHERE version != ?', (self.version,)
+        ).rowcount
+        db.commit()
+
+    @property
+    def db(self):
+        return self.connection.get() if self.connection is not None else None
+
+    def _remember(self, key, version, scores):
+        self.entries[key] = (version, scores)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    # Return the cached scores for text, or None
+    def get(self, text):
+        key = text_key(text)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                version, scores = entry
+                if version == self.version:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(scores)
+                del self.entries[key]
+                self.stale += 1
+
+            row = None
+            if self.connection is not None:
+                try:
+                    row = self.db.execute(
+                        'SELECT version, scores FROM sentiment_cache WHERE key = ?', (key,)
+                    ).fetchone()
+                except sqlite3.Error:
+                    self.disk_errors += 1
+                if row is not None and row[0] == self.version:
+                    scores = json.loads(row[1])
+                    self._remember(key, self.version, scores)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return dict(scores)
+
+            self.misses += 1
+            return None
+
+    def put(self, text, scores):
+        self.put_many([(text, scores)])
+
+    def put_many(self, items):
+        rows = []
+        with self.lock:
+            for text, scores in items:
+                key = text_key(text)
+                self._remember(key, self.version, dict(scores))
+                rows.append((key, self.version, json.dumps(scores)))
+            if self.connection is not None and rows:
+                try:
+                    db = self.db
+                    with db:
+                        db.executemany(
+                            'INSERT OR REPLACE INTO sentiment_cache (key, version, scores) VALUES (?, ?, ?)', rows
+                        )
+                except sqlite3.Error:
+                    # The scores stay in memory, the next worker to miss them writes them again
+                    self.disk_errors += 1
+
+    # Return the cached scores for text, computing and storing them on a miss
+    def get_or_compute(self, text, compute):
+        scores = self.get(text)
+        if scores is None:
+            scores = compute(text)
+            self.put(text, scores)
+        return scores
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'version': self.version,
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'stale': self.stale,
+                'disk_errors': self.disk_errors,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+            if self.connection is not None:
+                try:
+                    stats['disk_size'] = self.db.execute('SELECT COUNT(*) FROM sentiment_cache').fetchone()[0]
+                except sqlite3.Error:
+                    self.disk_errors += 1
+                    stats['disk_size'] = None
+            return stats
@@ -0,0 +1,114 @@
+import os
+import sys
+import threading
+import time
+from flask import Flask
+from flask_cors import CORS
+from sqlite_connection import close_all
+from instrumentation import get_logger
+import instrumentation
+
+# Each service module provides a blueprint, preload(), start_worker() and start_background()
+SERVICE_MODULES = ['app', 'reco', 'anomaly', 'aggregation']
+
+# Lock file held by the one worker that runs the Firestore syncs and model refits
+BACKGROUND_LOCK = os.environ.get('BACKGROUND_LOCK', 'background.lock')
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, where only the single process development server runs
+    fcntl = None
+
+_started = time.perf_counter()
+
+log = get_logger('server')
+
+
+# Resident set size of this process in MB
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return round(pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20, 1)
+    except (OSError, ValueError):
+        try:
+            import resource
+        except ImportError:
+            # Windows has neither /proc nor the resource module
+            return None
+        # Peak RSS: kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10), 1)
+
+
+def services():
+    return [__import__(name) for name in SERVICE_MODULES]
+
+
+# Application factory mounting /analyze, /recommend, /detect_anomalies and /rollups on one Flask app.
+# With preload=True the lexicons, catalog, models and pandas/sklearn are loaded now, so a
+# pre-forking server started with preload_app shares them copy-on-write with its workers.
+def create_app(preload=False):
+    app = Flask(__name__)
+    CORS(app, resources={r"/*": {"origins": "*"}})
+    for service in services():
+        app.register_blueprint(service.bp)
+    # Request counters and timings of every service, served on /metrics summed over all workers
+    app.register_blueprint(instrumentation.bp)
+    instrumentation.registry.share(instrumentation.METRICS_DIR)
+
+    if preload:
+        for service in services():
+            service.preload()
+        # SQLite connections must not be carried across fork, workers open their own
+        close_all()
+
+    log.info('EmoShown server ready', extra={'seconds': round(time.perf_counter() - _started, 2), 'rss_mb': rss_mb()})
+    return app
+
+
+_background_lock = None
+
+
+# Wait until this process holds the background lock, then start the syncs and refits.
+# The lock is released when the process exits, so if that worker dies another one takes over.
+def _run_background():
+    global _background_lock
+    lock_file = open(BACKGROUND_LOCK, 'a')
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+    _background_lock = lock_file
+    # A service that fails to start, e.g. without Firestore credentials, must not stop the others
+    failed = []
+    for service in services():
+        try:
+            service.start_background()
+        except Exception:
+            log.exception('Background jobs failed to start', extra={'service': service.__name__})
+            failed.append(service.__name__)
+    log.info('EmoShown background jobs started', extra={'failed': failed})
+
+
+# Run in each worker after it is forked. Every worker follows the shared mirror and models;
+# one of them, chosen by a file lock, also runs the Firestore syncs and refits.
+def init_worker():
+    for service in services():
+        service.start_worker()
+    threading.Thread(target=_run_background, name='background-lock', daemon=True).start()
+    log.info('EmoShown worker started', extra={'rss_mb': rss_mb()})
+
+
+# The app for a single process server, with the background jobs running in it.
+# gunicorn only runs on Linux/macOS; on Windows serve this with waitress instead:
+#   waitress-serve --port=5000 --call server:create_single_process_app
+def create_single_process_app():
+    app = create_app(preload=True)
+    init_worker()
+    return app
+
+
+if __name__ == '__main__':
+    # Single process development server; use gunicorn with gunicorn.conf.py in production
+    app = create_single_process_app()
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), use_reloader=False)
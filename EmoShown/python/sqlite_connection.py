@@ -0,0 +1,42 @@
+import os
+import sqlite3
+import threading
+import weakref
+
+_connections = weakref.WeakSet()
+
+
+# SQLite connection opened on first use and re-opened in forked worker processes.
+# A connection must not be carried across fork, so the server closes every connection
+# in the master after preloading (close_all) and each worker opens its own.
+class SqliteConnection:
+    def __init__(self, path, setup=None):
+        self.path = path
+        self.setup = setup
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+        _connections.add(self)
+
+    def get(self):
+        if self.conn is None or self.pid != os.getpid():
+            with self.lock:
+                if self.conn is None or self.pid != os.getpid():
+                    conn = sqlite3.connect(self.path, check_same_thread=False)
+                    if self.setup is not None:
+                        self.setup(conn)
+                    self.conn = conn
+                    self.pid = os.getpid()
+        return self.conn
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None and self.pid == os.getpid():
+                self.conn.close()
+            self.conn = None
+            self.pid = None
+
+
+def close_all():
+    for connection in list(_connections):
+        connection.close()
@@ -0,0 +1,239 @@
+import string
+from vaderSentiment.vaderSentiment import (
+    SentimentIntensityAnalyzer,
+    BOOSTER_DICT,
+    NEGATE,
+    SPECIAL_CASES,
+    C_INCR,
+    N_SCALAR,
+)
+
+# Largest number of distinct raw tokens kept in the token cache before it is reset
+TOKEN_CACHE_SIZE = 200000
+
+
+# Batch scoring engine built on top of a SentimentIntensityAnalyzer.
+# The lexicon, emoji map and the n-gram booster/negation/idiom tables are compiled
+# once into flat lookup structures, so scoring a text is a single pass over its
+# tokens. Results are identical to analyzer.polarity_scores(text).
+class VaderEngine:
+    def __init__(self, analyzer=None):
+        self.analyzer = analyzer or SentimentIntensityAnalyzer()
+        self.lexicon = self.analyzer.lexicon
+
+        # polarity_scores only replaces single characters, so only those emoji keys matter
+        self.emojis = {key: value for key, value in self.analyzer.emojis.items() if len(key) == 1}
+        self.emoji_chars = frozenset(self.emojis)
+
+        # Single word boosters, with the multi word ones ('kind of', 'sort of', ...) kept as tuples
+        self.boosters = {key: value for key, value in BOOSTER_DICT.items() if ' ' not in key}
+        self.booster_ngrams = {tuple(key.split(' ')): value for key, value in BOOSTER_DICT.items() if ' ' in key}
+        self.special_cases = {tuple(key.split(' ')): value for key, value in SPECIAL_CASES.items()}
+        self.negations = frozenset(NEGATE)
+
+        self.token_cache = {}
+
+    # Strip a raw token like SentiText does and return (lowercased word, is all caps), cached per raw token
+    def _token(self, token):
+        info = self.token_cache.get(token)
+        if info is None:
+            word = token.strip(string.punctuation)
+            if len(word) <= 2:
+                word = token
+            info = (word.lower(), word.isupper())
+            if len(self.token_cache) >= TOKEN_CACHE_SIZE:
+                self.token_cache.clear()
+            self.token_cache[token] = info
+        return info
+
+    # Replace emojis with their textual descriptions, same spacing rules as polarity_scores.
+    # Only the positions of emoji characters actually present in the text are visited.
+    def _demojize(self, text):
+        positions = []
+        for char in self.emoji_chars.intersection(text):
+            pos = text.find(char)
+            while pos != -1:
+                positions.append(pos)
+                pos = text.find(char, pos + 1)
+        positions.sort()
+
+        parts = []
+        last = 0
+        for pos in positions:
+            parts.append(text[last:pos])
+            # a space is inserted unless the emoji starts the text or follows a plain space
+            if pos > 0 and text[pos - 1] != ' ':
+                parts.append(' ')
+            parts.append(self.emojis[text[pos]])
+            last = pos + 1
+        parts.append(text[last:])
+        return ''.join(parts)
+
+    # Same result as SentimentIntensityAnalyzer._but_check. That method looks scores up with
+    # sentiments.index(value), so repeated values resolve to their first occurrence; the quirk is
+    # kept, but only non-zero scores are visited since zeros stay zero either way.
+    @staticmethod
+    def _but_check(lowers, sentiments):
+        bi = lowers.index('but')
+        nonzero = [k for k, sentiment in enumerate(sentiments) if sentiment != 0]
+        for k in nonzero:
+            sentiment = sentiments[k]
+            si = next(j for j in nonzero if sentiments[j] == sentiment)
+            if si < bi:
+                sentiments[si] = sentiment * 0.5
+            elif si > bi:
+                sentiments[si] = sentiment * 1.5
+        return sentiments
+
+    def _is_negated(self, word_lower):
+        return word_lower in self.negations or "n't" in word_lower
+
+    # Same rules as SentimentIntensityAnalyzer._special_idioms_check, on tuple lookups
+    def _special_idioms_check(self, valence, lowers, i):
+        sequences = [
+            (lowers[i - 1], lowers[i]),
+            (lowers[i - 2], lowers[i - 1], lowers[i]),
+            (lowers[i - 2], lowers[i - 1]),
+            (lowers[i - 3], lowers[i - 2], lowers[i - 1]),
+            (lowers[i - 3], lowers[i - 2]),
+        ]
+        for seq in sequences:
+            if seq in self.special_cases:
+                valence = self.special_cases[seq]
+                break
+
+        if len(lowers) - 1 > i:
+            seq = (lowers[i], lowers[i + 1])
+            if seq in self.special_cases:
+                valence = self.special_cases[seq]
+        if len(lowers) - 1 > i + 1:
+            seq = (lowers[i], lowers[i + 1], lowers[i + 2])
+            if seq in self.special_cases:
+                valence = self.special_cases[seq]
+
+        for n_gram in (sequences[3], sequences[4], sequences[2]):
+            if n_gram in self.booster_ngrams:
+                valence = valence + self.booster_ngrams[n_gram]
+        return valence
+
+    # Same rules as SentimentIntensityAnalyzer._negation_check
+    def _negation_check(self, valence, lowers, start_i, i):
+        if start_i == 0:
+            if self._is_negated(lowers[i - 1]):
+                valence = valence * N_SCALAR
+        elif start_i == 1:
+            if lowers[i - 2] == "never" and (lowers[i - 1] == "so" or lowers[i - 1] == "this"):
+                valence = valence * 1.25
+            elif lowers[i - 2] == "without" and lowers[i - 1] == "doubt":
+                pass
+            elif self._is_negated(lowers[i - 2]):
+                valence = valence * N_SCALAR
+        else:
+            if lowers[i - 3] == "never" and (lowers[i - 2] == "so" or lowers[i - 2] == "this") or \
+                    (lowers[i - 1] == "so" or lowers[i - 1] == "this"):
+                valence = valence * 1.25
+            elif lowers[i - 3] == "without" and (lowers[i - 2] == "doubt" or lowers[i - 1] == "doubt"):
+                pass
+            elif self._is_negated(lowers[i - 3]):
+                valence = valence * N_SCALAR
+        return valence
+
+    # Valence of the lexicon word at position i, see SentimentIntensityAnalyzer.sentiment_valence
+    def _valence(self, lowers, uppers, is_cap_diff, i):
+        lexicon = self.lexicon
+        boosters = self.boosters
+        n = len(lowers)
+        item_lowercase = lowers[i]
+        valence = lexicon[item_lowercase]
+
+        if item_lowercase == "no" and i != n - 1 and lowers[i + 1] in lexicon:
+            valence = 0.0
+        if (i > 0 and lowers[i - 1] == "no") \
+                or (i > 1 and lowers[i - 2] == "no") \
+                or (i > 2 and lowers[i - 3] == "no" and lowers[i - 1] in ("or", "nor")):
+            valence = lexicon[item_lowercase] * N_SCALAR
+
+        if uppers[i] and is_cap_diff:
+            if valence > 0:
+                valence += C_INCR
+            else:
+                valence -= C_INCR
+
+        for start_i in range(0, 3):
+            j = i - (start_i + 1)
+            if i > start_i and lowers[j] not in lexicon:
+                s = 0.0
+                if lowers[j] in boosters:
+                    s = boosters[lowers[j]]
+                    if valence < 0:
+                        s *= -1
+                    if uppers[j] and is_cap_diff:
+                        if valence > 0:
+                            s += C_INCR
+                        else:
+                            s -= C_INCR
+                if start_i == 1 and s != 0:
+                    s = s * 0.95
+                if start_i == 2 and s != 0:
+                    s = s * 0.9
+                valence = valence + s
+                valence = self._negation_check(valence, lowers, start_i, i)
+                if start_i == 2:
+                    valence = self._special_idioms_check(valence, lowers, i)
+
+        # check for negation case using "least"
+        if i > 1 and lowers[i - 1] not in lexicon and lowers[i - 1] == "least":
+            if lowers[i - 2] != "at" and lowers[i - 2] != "very":
+                valence = valence * N_SCALAR
+        elif i > 0 and lowers[i - 1] not in lexicon and lowers[i - 1] == "least":
+            valence = valence * N_SCALAR
+        return valence
+
+    # Drop-in replacement for analyzer.polarity_scores(text)
+    def polarity_scores(self, text):
+        if not isinstance(text, str):
+            return self.analyzer.polarity_scores(text)
+
+        if not self.emoji_chars.isdisjoint(text):
+            text = self._demojize(text)
+        text = text.strip()
+
+        tokens = [self._token(token) for token in text.split()]
+        lowers = [token[0] for token in tokens]
+        uppers = [token[1] for token in tokens]
+
+        # allcap_differential: some but not all words are ALL CAPS
+        allcap_words = sum(uppers)
+        is_cap_diff = 0 < len(tokens) - allcap_words < len(tokens)
+
+        lexicon = self.lexicon
+        boosters = self.boosters
+        n = len(lowers)
+        sentiments = []
+        for i, item_lowercase in enumerate(lowers):
+            if item_lowercase in boosters or item_lowercase not in lexicon:
+                sentiments.append(0)
+            elif item_lowercase == "kind" and i < n - 1 and lowers[i + 1] == "of":
+                sentiments.append(0)
+            else:
+                sentiments.append(self._valence(lowers, uppers, is_cap_diff, i))
+
+        if 'but' in lowers:
+            sentiments = self._but_check(lowers, sentiments)
+
+        return self.analyzer.score_valence(sentiments, text)
+
+    # Score a list of texts in one pass; repeated texts in the batch are only scored once
+    def score_batch(self, texts):
+        scored = {}
+        results = []
+        for text in texts:
+            key = text if isinstance(text, str) else None
+            if key is not None and key in scored:
+                results.append(dict(scored[key]))
+                continue
+            scores = self.polarity_scores(text)
+            if key is not None:
+                scored[key] = scores
+            results.append(scores)
+        return results